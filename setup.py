@@ -5,13 +5,20 @@ try:
 except ImportError:
     from distutils.core import setup
 
+import re
 
-import twentiment
+
+def _read_version():
+    # Parse the version instead of importing the package, which would pull
+    # in the whole package at install time.
+    with open('twentiment/__init__.py') as init:
+        return re.search(r"^__version__ = '([^']+)'", init.read(),
+                         re.MULTILINE).group(1)
 
 
 setup(
     name='twentiment',
-    version=twentiment.__version__,
+    version=_read_version(),
     description='Twitter sentiment analysis tool',
     long_description=open('README.rst').read(),
     author='Pascal Hartig',
@@ -20,7 +27,10 @@ setup(
     packages=['twentiment', 'twentiment.thirdparty'],
     package_data={'': ['LICENSE', 'README.rst']},
     include_package_data=True,
-    scripts=["bin/twentiment_server", "bin/twentiment_client"],
+    scripts=["bin/twentiment_server", "bin/twentiment_client",
+             "bin/twentiment_coordinator", "bin/twentiment_broker",
+             "bin/twentiment_score", "bin/twentiment_merge",
+             "bin/twentiment_benchmark", "bin/twentiment_label"],
     install_requires=[
         'pyzmq',
         'six==1.2.0'
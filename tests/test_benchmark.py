@@ -0,0 +1,36 @@
+"""
+Tests for the benchmarks.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+from unittest import TestCase
+
+from twentiment.benchmark import learning_curve, format_table
+
+
+TWEETS = ([('I love this car', 'positive'),
+           ('This view is amazing', 'positive'),
+           ('I feel great this morning', 'positive')] +
+          [('I do not like this car', 'negative'),
+           ('This view is horrible', 'negative'),
+           ('I feel tired this morning', 'negative')]) * 4
+
+
+class LearningCurveTestCase(TestCase):
+
+    def test_learning_curve(self):
+        results = learning_curve(TWEETS, [4, 5, 1, 0], test_size=6, seed=1,
+                                 processes=1)
+
+        # Samples are split evenly across labels, sizes below 2 mean all.
+        self.assertEqual([result['entries'] for result in results],
+                         [4, 4, 18, 18])
+        for result in results:
+            self.assertTrue(0 <= result['accuracy'] <= 1)
+            self.assertTrue(result['model_bytes'] > 0)
+
+        lines = format_table(results).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[0].split()[0] == 'entries')
@@ -0,0 +1,109 @@
+"""
+Tests for the load-balancing broker.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import time
+import tempfile
+import threading
+from unittest import TestCase
+
+import zmq
+
+from twentiment.broker import Broker, Worker, READY, REQUEST
+from twentiment.classifier import Classifier
+from twentiment.client import Client
+from twentiment.server import Server
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing'],
+    'negative': ['I do not like this car', 'This view is horrible'],
+}
+
+HEARTBEAT = 0.1
+
+
+class BrokerTestCase(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='twentiment-')
+        self.frontend = "ipc://{}/frontend".format(directory)
+        self.backend = "ipc://{}/backend".format(directory)
+        self.server = Server(Classifier.from_json({'trainingData': TWEETS}))
+
+        self.broker = Broker(self.frontend, self.backend,
+                             heartbeat=HEARTBEAT)
+        self.threads = [self.start(self.broker.run)]
+        self.workers = []
+        self.client = Client(self.frontend, timeout=5.0, retries=0)
+
+    def tearDown(self):
+        self.client.close()
+        for worker in self.workers:
+            worker.stop()
+        self.broker.stop()
+        for thread in self.threads:
+            thread.join()
+
+    def start(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def start_worker(self):
+        worker = Worker(self.server, self.backend, heartbeat=HEARTBEAT)
+        self.workers.append(worker)
+        self.threads.append(self.start(worker.run))
+
+    def test_round_trip(self):
+        self.start_worker()
+
+        self.assertEqual(self.client.request("GUESS I love this view"),
+                         "OK {}".format(self.server._guess(
+                             "I love this view")))
+
+    def test_requeue(self):
+        """Requests of workers that stop responding go to another worker"""
+
+        context = zmq.Context()
+        silent = context.socket(zmq.DEALER)
+        silent.setsockopt(zmq.RCVTIMEO, 5000)
+        silent.connect(self.backend)
+        silent.send(READY)
+
+        try:
+            reply = []
+            client = self.start(lambda: reply.append(
+                self.client.request("GUESS I love this view")))
+
+            self.assertEqual(silent.recv_multipart()[0], REQUEST)
+            self.start_worker()
+            client.join()
+        finally:
+            context.destroy(0)
+
+        self.assertEqual(reply, ["OK {}".format(
+            self.server._guess("I love this view"))])
+
+    def test_slow_request(self):
+        """Slow requests are answered once, as workers keep heartbeating"""
+
+        guess = self.server._commands['guess']
+        handled = []
+
+        def slow_guess(args):
+            handled.append(args)
+            time.sleep(HEARTBEAT * 5)
+            return guess(args)
+
+        self.server._commands['guess'] = slow_guess
+        self.start_worker()
+        self.start_worker()
+
+        self.assertTrue(self.client.request("GUESS amazing").startswith(
+            "OK "))
+        time.sleep(HEARTBEAT * 5)
+        self.assertEqual(handled, ['amazing'])
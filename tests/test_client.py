@@ -0,0 +1,90 @@
+"""
+Tests for the Python clients.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import asyncio
+import tempfile
+import threading
+from unittest import TestCase
+
+from twentiment.classifier import Classifier
+from twentiment.client import (Client, AsyncClient, ServerError,
+                               parse_guess)
+from twentiment.server import Server
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing'],
+    'negative': ['I do not like this car', 'This view is horrible'],
+}
+
+TEXTS = ['I love this view', 'This car is horrible', 'amazing']
+
+
+class ClientTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        classifier = Classifier.from_json({'trainingData': TWEETS})
+        cls.endpoint = "ipc://{}".format(os.path.join(
+            tempfile.mkdtemp(prefix='twentiment-'), 'server'))
+        cls.server = Server(classifier, cls.endpoint)
+
+        thread = threading.Thread(target=cls.server.run)
+        thread.daemon = True
+        thread.start()
+
+    def expected(self, text):
+        return float(self.server._guess(text))
+
+    def test_guess(self):
+        with Client(self.endpoint) as client:
+            for text in TEXTS:
+                self.assertEqual(client.guess(text), self.expected(text))
+
+            self.assertEqual(client.request("FOO bar"),
+                             "ERROR UNKNOWN_COMMAND")
+            with self.assertRaises(ServerError) as cm:
+                parse_guess(client.request("FOO bar"))
+            self.assertEqual(cm.exception.code, "UNKNOWN_COMMAND")
+
+    def test_guess_many(self):
+        """Batched guesses keep their order"""
+
+        texts = TEXTS * 50
+        with Client(self.endpoint, window=7) as client:
+            self.assertEqual(client.guess_many(texts),
+                             [self.expected(text) for text in texts])
+
+    def test_async_guess_many(self):
+        clients = []
+
+        async def guess_many():
+            async with AsyncClient(self.endpoint) as client:
+                clients.append(client)
+                return await client.guess_many(TEXTS)
+
+        self.assertEqual(asyncio.run(guess_many()),
+                         [self.expected(text) for text in TEXTS])
+        # The context the client created is terminated with it.
+        self.assertTrue(clients[0]._context.closed)
+
+    def test_timeout(self):
+        """Unanswered requests are retried, then given up"""
+
+        endpoint = "ipc://{}".format(os.path.join(tempfile.mkdtemp(),
+                                                  'nobody'))
+        with Client(endpoint, timeout=0.05, retries=1) as client:
+            self.assertRaises(TimeoutError, client.guess, "amazing")
+            self.assertRaises(TimeoutError, client.guess_many, TEXTS)
+
+        async def guess():
+            async with AsyncClient(endpoint, timeout=0.05,
+                                   retries=1) as client:
+                return await client.guess("amazing")
+
+        self.assertRaises(TimeoutError, asyncio.run, guess())
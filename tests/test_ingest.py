@@ -0,0 +1,107 @@
+"""
+Tests for the line-delimited training data ingestion.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import json
+import doctest
+import tempfile
+from unittest import TestCase
+
+from twentiment import ingest
+from twentiment.classifier import Classifier
+from twentiment.extract import extract_features
+from twentiment.text import normalize_text
+
+
+SAMPLES = os.path.join(os.path.dirname(__file__), '..', 'samples',
+                       'few_tweets.json')
+
+
+class IngestTestCase(TestCase):
+
+    def setUp(self):
+        with open(SAMPLES) as samples:
+            self.json = json.load(samples)
+
+        self.path = os.path.join(tempfile.mkdtemp(), 'tweets.jsonl')
+        with open(self.path, 'w') as out:
+            for label in ('positive', 'negative'):
+                for text in self.json['trainingData'][label]:
+                    out.write(json.dumps({'text': text, 'label': label}))
+                    out.write('\n')
+
+    def test_doctests(self):
+        self.assertEqual(doctest.testmod(ingest).failed, 0)
+
+    def test_byte_ranges(self):
+        """Every line is read exactly once, however the file is split"""
+
+        expected = list(ingest.read_labeled_texts(self.path))
+        for parts in (1, 2, 3, 7, 1000):
+            texts = []
+            for start, end in ingest.byte_ranges(self.path, parts):
+                texts.extend(ingest.read_labeled_texts(self.path, start, end))
+
+            self.assertEqual(texts, expected)
+
+    def test_parallel_featuresets(self):
+        """Featuresets come in the order of the file, across many chunks"""
+
+        expected = [(extract_features(normalize_text(text)), label)
+                    for (text, label) in ingest.read_labeled_texts(self.path)]
+        self.assertEqual(list(ingest.parallel_featuresets(
+            self.path, processes=2, chunk_bytes=64)), expected)
+
+    def test_malformed_lines(self):
+        """Malformed lines are reported with the file and byte offset"""
+
+        with open(self.path, 'rb') as file:
+            offset = len(file.read())
+        for line in ('{"text": "no label"}', '{"text": ', '[1, 2]'):
+            path = os.path.join(tempfile.mkdtemp(), 'tweets.jsonl')
+            with open(path, 'wb') as out, open(self.path, 'rb') as good:
+                out.write(good.read() + line.encode('utf-8') + b'\n')
+
+            for processes in (None, 2):
+                with self.assertRaisesRegex(ValueError, "byte {} of {}".format(
+                        offset, path)):
+                    Classifier.from_path(path, processes=processes)
+
+        path = os.path.join(tempfile.mkdtemp(), 'tweets.tsv')
+        with open(path, 'w') as out:
+            out.write('positive\tso good\nno tab\n')
+        with self.assertRaisesRegex(ValueError, "byte 17 of"):
+            list(ingest.read_labeled_texts(path))
+
+    def test_classifier_from_jsonl(self):
+        """Training from JSONL matches training from the JSON document"""
+
+        from_json = Classifier.from_json(self.json)
+        from_jsonl = Classifier.from_path(self.path)
+        from_parallel = Classifier.from_path(self.path, processes=2)
+
+        featureset = {'car': True, 'friend': True, 'enemy': True}
+        expected = from_json.prob_classify(featureset).prob('positive')
+        for classifier in (from_jsonl, from_parallel):
+            self.assertAlmostEqual(
+                classifier.prob_classify(featureset).prob('positive'),
+                expected)
+
+    def test_classifier_from_counts_file(self):
+        """Saved counts train the same model, but can't be subsampled"""
+
+        counts_path = os.path.join(os.path.dirname(self.path),
+                                   'tweets.counts')
+        trained = Classifier.from_path(self.path, save_counts=counts_path)
+        loaded = Classifier.from_path(counts_path)
+
+        featureset = {'car': True, 'friend': True, 'enemy': True}
+        self.assertAlmostEqual(
+            loaded.prob_classify(featureset).prob('positive'),
+            trained.prob_classify(featureset).prob('positive'))
+        self.assertRaises(ValueError, Classifier.from_path, counts_path,
+                          max_entries=4)
@@ -0,0 +1,90 @@
+"""
+Tests for the emoticon labeling.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import io
+import os
+import json
+import doctest
+import tempfile
+from unittest import TestCase
+
+from twentiment import label
+from twentiment.classifier import Classifier
+
+
+DUMP = [
+    {'id': 1, 'text': 'I love this car :)'},
+    {'id': 2, 'text': 'This view is horrible :-('},
+    {'id': 3, 'text': 'I feel great this\u2026',
+     'full_text': 'I feel great this morning (:'},
+    {'id': 4, 'text': 'Not sure :) :('},
+    {'id': 5, 'text': 'No emoticons here'},
+    {'delete': {'status': {'id': 6}}},
+    {'id': 7, 'full_text': 'I do not like this car ):'},
+    {'id': 8, 'text': 'What a view\u2026', 'truncated': True,
+     'extended_tweet': {'full_text': 'What a view from up here :)'}},
+]
+
+
+class LabelTestCase(TestCase):
+
+    def setUp(self):
+        self.lines = [json.dumps(record) + '\n' for record in DUMP]
+        self.lines.insert(3, '{"truncated\n')
+
+    def test_doctests(self):
+        self.assertEqual(doctest.testmod(label).failed, 0)
+
+    def test_label_lines(self):
+        output, outcomes = label.label_lines(self.lines)
+
+        self.assertEqual([json.loads(line) for line in output], [
+            {'text': 'I love this car', 'label': 'positive'},
+            {'text': 'This view is horrible', 'label': 'negative'},
+            {'text': 'I feel great this morning', 'label': 'positive'},
+            {'text': 'I do not like this car', 'label': 'negative'},
+            {'text': 'What a view from up here', 'label': 'positive'},
+        ])
+        self.assertEqual(label.format_outcomes(outcomes),
+                         'positive=3 negative=2 ambiguous=1 unlabeled=2 '
+                         'malformed=1')
+
+        output, _ = label.label_lines(self.lines[:1], keep_emoticons=True)
+        self.assertEqual(json.loads(output[0])['text'], 'I love this car :)')
+
+    def test_strip_whole_tokens(self):
+        """Only standalone emoticons are stripped, not punctuation"""
+
+        line = json.dumps({'text': 'call me (see below): ok :)'})
+        output, _ = label.label_lines([line])
+        self.assertEqual(json.loads(output[0])['text'],
+                         'call me (see below): ok')
+
+    def test_label_files(self):
+        """Labeling in parallel keeps the order and trains a classifier"""
+
+        path = os.path.join(tempfile.mkdtemp(), 'dump.jsonl')
+        with open(path, 'w') as dump:
+            dump.writelines(self.lines * 20)
+        # A line that isn't valid UTF-8 only counts as malformed.
+        with open(path, 'ab') as dump:
+            dump.write(b'{"text": "\xff :)"}\n')
+
+        out = io.StringIO()
+        outcomes = label.label_files([path, path], out, processes=2,
+                                     chunk_bytes=100)
+        expected, _ = label.label_lines(self.lines * 40)
+
+        self.assertEqual(out.getvalue(), ''.join(expected))
+        self.assertEqual(outcomes['positive'], 120)
+        self.assertEqual(outcomes['malformed'], 42)
+
+        training = os.path.join(os.path.dirname(path), 'training.jsonl')
+        with open(training, 'w') as file:
+            file.write(out.getvalue())
+        classifier = Classifier.from_path(training)
+        self.assertTrue(classifier.score('I love this car') > 0)
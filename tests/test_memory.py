@@ -0,0 +1,45 @@
+"""
+Tests for the model memory accounting.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import tracemalloc
+from unittest import TestCase
+
+from twentiment.classifier import Classifier
+from twentiment.memory import CATEGORIES
+from twentiment.profiling import PhaseTimer
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing'],
+    'negative': ['I do not like this car', 'This view is horrible'],
+}
+
+
+class MemoryReportTestCase(TestCase):
+
+    def test_memory_report(self):
+        classifier = Classifier.from_json({'trainingData': TWEETS})
+        report = classifier.memory_report()
+
+        self.assertEqual(list(report), list(CATEGORIES) + ['total'])
+        self.assertEqual(report['total'], sum(report[category]
+                                              for category in CATEGORIES))
+        for category in ('vocabulary', 'keys', 'freqdists', 'probdists'):
+            self.assertTrue(report[category] > 0, category)
+
+    def test_trace_memory(self):
+        """Training records the peak memory of each phase"""
+
+        timer = PhaseTimer(trace_memory=True)
+        Classifier.from_json({'trainingData': TWEETS}, timer=timer)
+
+        self.assertEqual([name for (name, _) in timer.phases],
+                         ['split', 'count', 'estimate'])
+        self.assertTrue(all(timer.peaks[name] > 0 for name in timer.peaks))
+
+        timer.close()
+        self.assertFalse(tracemalloc.is_tracing())
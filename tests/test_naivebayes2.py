@@ -4,10 +4,14 @@ More elaborate tests for the naive bayes classifier.
 :author: 2012, Pascal Hartig <phartig@weluse.de>
 """
 
+import io
 from unittest import TestCase
 
-from twentiment.thirdparty.probability import FreqDist
-from twentiment.naivebayes import NaiveBayesClassifier
+from twentiment.thirdparty.probability import (FreqDist, LidstoneProbDist,
+                                               CrossValidationProbDist)
+from twentiment.naivebayes import (NaiveBayesClassifier, NaiveBayesCounts,
+                                   WindowedCounts, ESTIMATORS,
+                                   _with_unseen_bin)
 from twentiment.text import normalize_text
 
 
@@ -41,6 +45,7 @@ class NaiveBayesTestCase2(TestCase):
         training_set = [(extract_features(doc), label) for (doc, label)
                         in tweets]
 
+        self.training_set = training_set
         self.classifier = NaiveBayesClassifier.train(training_set)
 
     def test_garbage(self):
@@ -70,3 +75,170 @@ class NaiveBayesTestCase2(TestCase):
         score = prob_result.prob('positive') - prob_result.prob('negative')
 
         self.assertEqual(score, 0)
+
+    def test_compact(self):
+        """The compact classifier yields the same probabilities"""
+
+        compact = self.classifier.compact()
+        for text in ("This car is my best friend and enemy.",
+                     "friend and enemy", "goregho regeorg egewg",
+                     "I feel tired"):
+            twfeat = extract_features(normalize_text(text))
+            expected = self.classifier.prob_classify(twfeat)
+            result = compact.prob_classify(twfeat)
+
+            self.assertEqual(result.max(), expected.max())
+            self.assertAlmostEqual(result.prob('positive'),
+                                   expected.prob('positive'))
+
+    def test_compact_slots(self):
+        """The compact classifier has no per-instance __dict__"""
+
+        self.assertFalse(hasattr(self.classifier.compact(), '__dict__'))
+
+    def test_precompute(self):
+        """Precomputed estimators yield the same probabilities"""
+
+        for name, estimator in sorted(ESTIMATORS.items()):
+            classifier = NaiveBayesClassifier.train(self.training_set,
+                                                    estimator)
+            frozen = NaiveBayesClassifier.train(self.training_set, estimator,
+                                                precompute=True)
+
+            for text in ("This car is my best friend and enemy.",
+                         "goregho regeorg egewg", "I feel tired"):
+                twfeat = extract_features(normalize_text(text))
+                expected = classifier.prob_classify(twfeat)
+                result = frozen.prob_classify(twfeat)
+
+                self.assertAlmostEqual(result.prob('positive'),
+                                       expected.prob('positive'), msg=name)
+
+    def test_counts_round_trip(self):
+        """Estimating from saved counts is the same as training"""
+
+        counts = NaiveBayesCounts()
+        counts.update(self.training_set)
+        file = io.StringIO()
+        counts.dump(file)
+        file.seek(0)
+        loaded = NaiveBayesCounts.load(file)
+
+        self.assertEqual(loaded.label_freqdist, counts.label_freqdist)
+        self.assertEqual(dict(loaded.feature_freqdist),
+                         dict(counts.feature_freqdist))
+
+        classifier = NaiveBayesClassifier.estimate(loaded)
+        twfeat = extract_features(normalize_text("I feel tired"))
+        self.assertEqual(
+            classifier.prob_classify(twfeat).prob('positive'),
+            self.classifier.prob_classify(twfeat).prob('positive'))
+
+    def test_estimate_params(self):
+        """Estimator parameters are passed on"""
+
+        counts = NaiveBayesCounts()
+        counts.update(self.training_set)
+        twfeat = extract_features(normalize_text("I feel tired"))
+
+        # ELE is Lidstone with a gamma of 0.5.
+        lidstone = NaiveBayesClassifier.estimate(counts, LidstoneProbDist,
+                                                 gamma=0.5)
+        self.assertAlmostEqual(
+            lidstone.prob_classify(twfeat).prob('positive'),
+            self.classifier.prob_classify(twfeat).prob('positive'))
+
+        lidstone = NaiveBayesClassifier.estimate(counts, LidstoneProbDist,
+                                                 gamma=0.01)
+        self.assertNotAlmostEqual(
+            lidstone.prob_classify(twfeat).prob('positive'),
+            self.classifier.prob_classify(twfeat).prob('positive'))
+
+        # Also through estimators reserving a bin for unseen values, which
+        # cancels out when classifying.
+        unseen = NaiveBayesClassifier.estimate(
+            counts, _with_unseen_bin(LidstoneProbDist), gamma=0.01)
+        self.assertAlmostEqual(
+            unseen.prob_classify(twfeat).prob('positive'),
+            lidstone.prob_classify(twfeat).prob('positive'))
+
+    def test_estimate_consume(self):
+        """Consuming the counts gives the same model"""
+
+        counts = NaiveBayesCounts()
+        counts.update(self.training_set)
+        twfeat = extract_features(normalize_text("I feel tired"))
+
+        classifier = NaiveBayesClassifier.estimate(counts, consume=True)
+        self.assertFalse(counts.feature_freqdist)
+        self.assertAlmostEqual(
+            classifier.prob_classify(twfeat).prob('positive'),
+            self.classifier.prob_classify(twfeat).prob('positive'))
+
+    def test_cross_validation(self):
+        """Shared cross-validation estimates match per-feature ones"""
+
+        folds = NaiveBayesCounts.folds(self.training_set, 3)
+        classifier = NaiveBayesClassifier.estimate_cross_validation(folds)
+
+        for fname in ('car', 'love', 'enemy'):
+            freqdists = []
+            for counts in folds:
+                freqdist = counts.feature_freqdist[('positive', fname)].copy()
+                freqdist.inc(None, counts.label_freqdist['positive'] -
+                             freqdist.N())
+                freqdists.append(freqdist)
+            expected = CrossValidationProbDist(freqdists, 2)
+            probdist = classifier._feature_probdist[('positive', fname)]
+
+            for fval in (True, None):
+                self.assertEqual(probdist.prob(fval), expected.prob(fval))
+
+    def test_folds_need_every_label(self):
+        """Folds lacking a label are rejected"""
+
+        folds = NaiveBayesCounts.folds(self.training_set[:1], 2)
+        self.assertRaises(ValueError,
+                          NaiveBayesClassifier.estimate_heldout, *folds)
+
+    def test_merge_counts(self):
+        """Merged counts equal the counts of the whole training set"""
+
+        def dump(training_set):
+            counts = NaiveBayesCounts()
+            counts.update(training_set)
+            file = io.StringIO()
+            counts.dump(file)
+            file.seek(0)
+            return file
+
+        merged = io.StringIO()
+        NaiveBayesCounts.merge([dump(self.training_set[:3]),
+                                dump(self.training_set[3:7]),
+                                dump(self.training_set[7:])], merged)
+
+        self.assertEqual(merged.getvalue(),
+                         dump(self.training_set).getvalue())
+
+    def test_windowed_counts(self):
+        """Expired epochs are subtracted and their features pruned"""
+
+        windowed = WindowedCounts(2)
+        for n, (featureset, label) in enumerate(self.training_set):
+            windowed.add(featureset, label)
+            if n % 2 == 1:
+                windowed.advance()
+
+        # The window holds the current, empty epoch and the last pair.
+        recent = NaiveBayesCounts()
+        recent.update(self.training_set[-2:])
+
+        self.assertEqual(dict(windowed.label_freqdist),
+                         dict(recent.label_freqdist))
+        self.assertEqual(windowed.label_freqdist.N(), 2)
+        self.assertEqual(
+            {key: dict(freqdist) for (key, freqdist)
+             in windowed.feature_freqdist.items()},
+            {key: dict(freqdist) for (key, freqdist)
+             in recent.feature_freqdist.items()})
+        self.assertRaises(ValueError, WindowedCounts, 0)
@@ -0,0 +1,114 @@
+"""
+Tests for pre-forked serving.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import gc
+import sys
+import time
+import signal
+import tempfile
+import multiprocessing
+from unittest import TestCase, skipUnless
+
+from twentiment.client import Client
+from twentiment.classifier import Classifier
+from twentiment.naivebayes import CompactNaiveBayesClassifier
+from twentiment.prefork import Prefork, freeze, unique_set_size
+from twentiment.server import Server
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing'],
+    'negative': ['I do not like this car', 'This view is horrible'],
+}
+
+#: The same tweets with the labels swapped, loaded on reload.
+SWAPPED = {'positive': TWEETS['negative'], 'negative': TWEETS['positive']}
+
+
+def load_swapped(path):
+    return Classifier.from_json({'trainingData': SWAPPED})
+
+
+def children(pid):
+    with open('/proc/{0}/task/{0}/children'.format(pid)) as proc:
+        return set(int(child) for child in proc.read().split())
+
+
+class PreforkTestCase(TestCase):
+
+    def tearDown(self):
+        gc.unfreeze()
+
+    def test_freeze(self):
+        """Frozen models are compact and score the same"""
+
+        classifier = Classifier.from_json({'trainingData': TWEETS})
+        frozen = freeze(classifier)
+
+        self.assertIsInstance(frozen.classifier, CompactNaiveBayesClassifier)
+        self.assertTrue(gc.get_freeze_count() > 0)
+        self.assertAlmostEqual(frozen.score('I love this view'),
+                               classifier.score('I love this view'))
+
+    @skipUnless(sys.platform.startswith('linux'), "needs /proc")
+    def test_unique_set_size(self):
+        self.assertTrue(unique_set_size(os.getpid()) > 0)
+        self.assertIsNone(unique_set_size(-1))
+
+
+@skipUnless(os.path.exists('/proc/self/task/{0}/children'.format(
+    os.getpid())), "needs /proc/<pid>/task/<pid>/children")
+class PreforkServingTestCase(TestCase):
+
+    def setUp(self):
+        bind = "ipc://{}/frontend".format(tempfile.mkdtemp(
+            prefix='twentiment-'))
+        server = Server(Classifier.from_json({'trainingData': TWEETS}),
+                        bind=bind, loader=load_swapped, source='swapped')
+        prefork = Prefork(server, workers=2, report_interval=None)
+        prefork.CHECK_INTERVAL = 0.05
+
+        self.process = multiprocessing.get_context('fork').Process(
+            target=prefork.run)
+        self.process.start()
+        self.client = Client(bind, timeout=2.0)
+        self.workers = self.wait_for_workers(set())
+
+    def tearDown(self):
+        self.client.close()
+        self.process.terminate()
+        self.process.join(10)
+
+    def wait_for_workers(self, old):
+        """Waits until there are two workers, none of them in ``old``."""
+
+        for _ in range(100):
+            workers = children(self.process.pid)
+            if len(workers) == 2 and not workers & old:
+                return workers
+            time.sleep(0.05)
+
+        self.fail("Workers weren't replaced: {}".format(workers))
+
+    def test_respawn(self):
+        """Workers that die are replaced"""
+
+        score = self.client.guess('I love this view')
+        os.kill(min(self.workers), signal.SIGKILL)
+
+        self.wait_for_workers({min(self.workers)})
+        self.assertEqual(self.client.guess('I love this view'), score)
+
+    def test_reload(self):
+        """SIGHUP reloads the model in the parent and replaces the workers"""
+
+        score = self.client.guess('I love this view')
+        os.kill(self.process.pid, signal.SIGHUP)
+
+        self.wait_for_workers(self.workers)
+        self.assertAlmostEqual(self.client.guess('I love this view'), -score)
@@ -15,3 +15,46 @@ class ProbabilityTestCase(TestCase):
         from twentiment.thirdparty.probability import sum_logs
 
         self.assertEqual(sum_logs([]), _NINF)
+
+    def test_freeze(self):
+        from twentiment.thirdparty.probability import (
+            FreqDist, FrozenProbDist, GoodTuringProbDist,
+            SimpleGoodTuringProbDist, DictionaryProbDist)
+
+        fdist = FreqDist('abracadabra')
+        for estimator in (GoodTuringProbDist, SimpleGoodTuringProbDist):
+            probdist = estimator(fdist, bins=10)
+            frozen = probdist.freeze()
+
+            self.assertIsInstance(frozen, FrozenProbDist)
+            for sample in 'abcdrz':
+                self.assertEqual(frozen.prob(sample), probdist.prob(sample))
+                self.assertEqual(frozen.logprob(sample),
+                                 probdist.logprob(sample))
+
+        # Distributions that aren't based on counts can't be frozen.
+        probdist = DictionaryProbDist({'a': 0.5, 'b': 0.5})
+        self.assertIs(probdist.freeze(), probdist)
+
+    def test_pickle_freqdist(self):
+        import pickle
+        from twentiment.thirdparty.probability import FreqDist
+
+        fdist = FreqDist('abracadabra')
+        copy = pickle.loads(pickle.dumps(fdist))
+
+        self.assertEqual(copy, fdist)
+        self.assertEqual(copy.N(), fdist.N())
+
+    def test_heldout(self):
+        from twentiment.thirdparty.probability import (FreqDist,
+                                                       HeldoutProbDist)
+
+        base = FreqDist({'a': 3, 'b': 1, 'c': 1})
+        heldout = FreqDist({'a': 2, 'b': 1, 'd': 1})
+        probdist = HeldoutProbDist(base, heldout, bins=4)
+
+        # Tr[r] / (Nr[r] * N)
+        self.assertEqual(probdist.prob('a'), 2 / (1 * 4))
+        self.assertEqual(probdist.prob('b'), 1 / (2 * 4))
+        self.assertEqual(probdist.prob('d'), 1 / (1 * 4))
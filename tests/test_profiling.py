@@ -0,0 +1,57 @@
+"""
+Tests for the training instrumentation.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import io
+from unittest import TestCase
+
+from twentiment.classifier import Classifier
+from twentiment.profiling import Progress, tracked
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing'],
+    'negative': ['I do not like this car', 'This view is horrible'],
+}
+
+
+class ProgressTestCase(TestCase):
+
+    def test_training_phases(self):
+        """Training reports every phase once it is done"""
+
+        out = io.StringIO()
+        progress = Progress(out)
+        Classifier.from_file(io.StringIO('{"trainingData": {"positive": '
+                                         '["so good"], "negative": '
+                                         '["so bad"]}}'), progress=progress)
+
+        self.assertEqual([phase for (phase, _, _, _) in progress.phases],
+                         ['parse', 'normalize', 'featurize', 'count',
+                          'backfill', 'estimate'])
+        self.assertEqual(progress.phases[3][1], 2)
+        # so, good, bad
+        self.assertEqual(progress.phases[3][3], 3)
+        self.assertIn("count: done, 2 docs", out.getvalue())
+
+    def test_tracked(self):
+        """Progress is reported every few items, and the vocabulary is only
+        looked up when printed
+        """
+
+        calls = []
+        items = list(tracked(range(5), lambda *args, **kwargs:
+                             calls.append((args, kwargs)), 'work', every=2))
+
+        self.assertEqual(items, list(range(5)))
+        self.assertEqual([args[1] for (args, _) in calls], [0, 2, 4, 5])
+        self.assertEqual(calls[-1][1], {'final': True})
+
+        vocabulary = []
+        progress = Progress(io.StringIO(), interval=3600)
+        list(tracked(range(5), progress, 'work',
+                     lambda: vocabulary.append(1) or 1, every=1))
+        self.assertEqual(len(vocabulary), 1)
@@ -0,0 +1,129 @@
+"""
+Tests for the progressive start-up.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import io
+import time
+import threading
+from contextlib import redirect_stderr
+from unittest import TestCase
+
+from twentiment.classifier import Classifier
+from twentiment.progressive import ProgressiveTrainer
+from twentiment.server import Server
+
+
+TWEETS = [
+    ('I love this car', 'positive'),
+    ('This view is amazing', 'positive'),
+    ('I feel great this morning', 'positive'),
+    ('I do not like this car', 'negative'),
+    ('This view is horrible', 'negative'),
+    ('I feel tired this morning', 'negative'),
+]
+
+
+class ProgressiveTestCase(TestCase):
+
+    def setUp(self):
+        self.server = Server(None)
+
+    def test_not_ready(self):
+        self.assertEqual(self.server._handle_message("GUESS amazing"),
+                         "ERROR NOT_READY")
+        self.assertEqual(self.server._handle_message("STATUS"),
+                         "OK ready=0")
+
+    def test_training(self):
+        """All tweets end up in the last snapshot"""
+
+        trainer = ProgressiveTrainer(self.server, iter(TWEETS), initial=1,
+                                     interval=0.0)
+        trainer.CHECK_EVERY = 1
+        trainer.start().join()
+
+        self.assertEqual(
+            self.server._handle_message("STATUS"),
+            "OK ready=1 training=done trained=6 model=6 snapshots=5 "
+            "window=-")
+
+        classifier = Classifier.from_labeled_texts(TWEETS)
+        self.assertEqual(self.server._handle_message("GUESS I feel great"),
+                         "OK {}".format(classifier.score("I feel great")))
+
+    def test_serving_while_training(self):
+        """The first snapshot is served while the rest is trained"""
+
+        resume = threading.Event()
+
+        def tweets():
+            yield from TWEETS[:4]
+            resume.wait()
+            yield from TWEETS[4:]
+
+        trainer = ProgressiveTrainer(self.server, tweets(), initial=1,
+                                     interval=60.0)
+        thread = trainer.start()
+        while trainer.snapshots == 0:
+            time.sleep(0.01)
+
+        # The first negative tweet is the fourth, the positive ones read
+        # before it are counted after the first snapshot.
+        self.assertEqual(trainer.published, 2)
+        self.assertTrue(self.server._handle_message("STATUS").startswith(
+            "OK ready=1 training=running "))
+        self.assertTrue(self.server._handle_message(
+            "GUESS amazing").startswith("OK "))
+        self.assertRaises(RuntimeError, self.server.reload, 'tweets.json')
+
+        resume.set()
+        thread.join()
+        self.assertEqual(trainer.published, 6)
+
+    def test_failure(self):
+        """Failed training is reported by STATUS"""
+
+        def tweets():
+            yield from TWEETS
+            raise FileNotFoundError("tweets.json")
+
+        trainer = ProgressiveTrainer(self.server, tweets(), initial=1)
+        with redirect_stderr(io.StringIO()) as stderr:
+            trainer.start().join()
+
+        self.assertIn("tweets.json", stderr.getvalue())
+
+        self.assertIsInstance(trainer.error, FileNotFoundError)
+        self.assertTrue(self.server._handle_message("STATUS").startswith(
+            "OK ready=1 training=failed "))
+        self.assertTrue(self.server._handle_message("STATUS").endswith(
+            " error=FileNotFoundError"))
+
+    def test_unknown_labels(self):
+        """Tweets of complete labels are only held up to max_deferred"""
+
+        tweets = iter(TWEETS[:3] + [('Just a tweet', 'neutral')] * 10)
+        trainer = ProgressiveTrainer(self.server, tweets, initial=1,
+                                     labels=('positive', 'neutral'),
+                                     max_deferred=1)
+        with redirect_stderr(io.StringIO()):
+            trainer.start().join()
+
+        self.assertIsInstance(trainer.error, ValueError)
+        self.assertFalse(self.server.ready())
+
+    def test_window(self):
+        """Only the tweets of the last intervals are in the model"""
+
+        trainer = ProgressiveTrainer(self.server, iter(TWEETS), initial=1,
+                                     interval=0.0, window=2)
+        trainer.CHECK_EVERY = 1
+        trainer.start().join()
+
+        self.assertEqual(trainer.model_size, 2)
+        classifier = Classifier.from_labeled_texts(TWEETS[-2:])
+        self.assertEqual(self.server._handle_message("GUESS I feel great"),
+                         "OK {}".format(classifier.score("I feel great")))
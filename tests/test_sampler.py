@@ -0,0 +1,36 @@
+"""
+Tests for the sampling profiler.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import time
+import tempfile
+from unittest import TestCase
+from twentiment.sampler import StackSampler
+
+
+def _busy_loop(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class StackSamplerTestCase(TestCase):
+
+    def test_collapsed_stacks(self):
+        """Samples of the profiled thread are written as collapsed stacks"""
+
+        path = os.path.join(tempfile.mkdtemp(), 'profile.folded')
+        sampler = StackSampler(interval=0.001)
+        sampler.start(10, path)
+        _busy_loop(0.2)
+        sampler.stop()
+
+        self.assertFalse(sampler.running)
+        with open(path) as profile:
+            stacks = profile.read()
+
+        self.assertIn('tests.test_sampler:_busy_loop', stacks)
@@ -0,0 +1,45 @@
+"""
+Tests for the streaming samplers.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import doctest
+from unittest import TestCase
+from twentiment.sampling import stratified_reservoir
+
+
+class StratifiedReservoirTestCase(TestCase):
+
+    def _items(self):
+        return ((n, 'pos' if n % 3 else 'neg') for n in range(3000))
+
+    def test_doctests(self):
+        from twentiment import sampling
+
+        self.assertEqual(doctest.testmod(sampling).failed, 0)
+
+    def test_small_labels_kept(self):
+        """Labels with fewer items than the size are kept completely"""
+
+        sample = stratified_reservoir([(1, 'a'), (2, 'a'), (3, 'b')], 5)
+        self.assertEqual(sample, {'a': [1, 2], 'b': [3]})
+
+    def test_seed(self):
+        """Sampling with the same seed is reproducible"""
+
+        first = stratified_reservoir(self._items(), 10, seed=1)
+        second = stratified_reservoir(self._items(), 10, seed=1)
+        self.assertEqual(first, second)
+
+    def test_uniform(self):
+        """Items late in the stream are as likely to be sampled"""
+
+        late = 0
+        for seed in range(50):
+            sample = stratified_reservoir(self._items(), 10, seed=seed)
+            late += len([n for n in sample['pos'] if n >= 1500])
+
+        # 50 * 10 items sampled, about half should come from the second half.
+        self.assertTrue(180 < late < 320, late)
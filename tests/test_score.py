@@ -0,0 +1,58 @@
+"""
+Tests for the offline bulk scoring.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import io
+import doctest
+from collections import Counter
+from unittest import TestCase
+
+from twentiment import score
+from twentiment.classifier import Classifier
+from twentiment.score import read_records, score_stream
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing'],
+    'negative': ['I do not like this car', 'This view is horrible'],
+}
+
+
+class ScoreTestCase(TestCase):
+
+    def test_doctests(self):
+        self.assertEqual(doctest.testmod(score).failed, 0)
+
+    def test_order(self):
+        """Results are written in input order, with and without a pool"""
+
+        classifier = Classifier.from_json({'trainingData': TWEETS})
+        lines = ['{{"id": {}, "text": "{}"}}'.format(n, text)
+                 for n in range(100)
+                 for text in ('love it', 'horrible', 'car')]
+
+        outputs = []
+        for processes in (1, 2):
+            out = io.StringIO()
+            count = score_stream(classifier, read_records(lines, 'jsonl'),
+                                 out, processes=processes, batch_size=7)
+            self.assertEqual(count, len(lines))
+            outputs.append(out.getvalue())
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertIn('"id": 99', outputs[0].splitlines()[-1])
+
+    def test_malformed(self):
+        """Malformed JSON lines are counted and skipped"""
+
+        lines = ['{"text": "love it"}', '{"text": ', '{"id": 1}', '[1]',
+                 '{"text": 2}', '', '{"text": "horrible"}']
+        skipped = Counter()
+
+        records = list(read_records(lines, 'jsonl', skipped))
+        self.assertEqual([text for (_, text) in records],
+                         ['love it', 'horrible'])
+        self.assertEqual(skipped['malformed'], 4)
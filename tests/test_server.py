@@ -0,0 +1,244 @@
+"""
+Tests for the request handling of the server.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import gc
+import time
+import signal
+import tempfile
+import threading
+from unittest import TestCase
+
+import zmq
+
+from twentiment.classifier import Classifier
+from twentiment.server import Server, Pipeline
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing'],
+    'negative': ['I do not like this car', 'This view is horrible'],
+}
+
+
+class ServerTestCase(TestCase):
+
+    def setUp(self):
+        classifier = Classifier.from_json({'trainingData': TWEETS})
+        self.server = Server(classifier, max_input=10)
+
+    def test_commands(self):
+        self.assertEqual(self.server._handle_message("GUESS"),
+                         "ERROR BAD_FORMAT")
+        self.assertEqual(self.server._handle_message("FOO bar"),
+                         "ERROR UNKNOWN_COMMAND")
+        self.assertTrue(self.server._handle_message(
+            "guess amazing").startswith("OK "))
+
+    def test_deadline(self):
+        """Requests past their deadline are dropped"""
+
+        past, future = time.time() - 1, time.time() + 60
+
+        self.assertIsNone(self.server._handle_message(
+            "DEADLINE {} GUESS amazing".format(past)))
+        self.assertEqual(
+            self.server._handle_message("DEADLINE {} GUESS amazing".format(
+                future)),
+            self.server._handle_message("GUESS amazing"))
+        for deadline in ('soon', 'nan', 'inf', '-1'):
+            self.assertEqual(self.server._handle_message(
+                "DEADLINE {} GUESS x".format(deadline)), "ERROR BAD_FORMAT")
+
+    def test_nested_deadline(self):
+        """Only one DEADLINE prefix is allowed, and requests are bounded"""
+
+        future = time.time() + 60
+        self.assertEqual(self.server._handle_message(
+            "DEADLINE {0} DEADLINE {0} STATUS".format(future)),
+            "ERROR BAD_REQUEST")
+        self.assertEqual(self.server._handle_message(
+            "DEADLINE 1e30 " * 3000 + "STATUS"), "ERROR BAD_REQUEST")
+        self.assertEqual(self.server._handle_message(
+            "GUESS " + "a" * Server.MAX_MESSAGE), "ERROR TOO_LARGE")
+
+    def test_nested_id(self):
+        """Only one ID prefix is allowed, next to a DEADLINE"""
+
+        self.assertEqual(self.server._handle_message("ID a ID b STATUS"),
+                         "ERROR BAD_REQUEST")
+        self.assertEqual(self.server._handle_message(
+            "ID a " * 20000 + "STATUS"), "ERROR TOO_LARGE")
+        self.assertEqual(self.server._handle_message(
+            "ID a DEADLINE {} ID b STATUS".format(time.time() + 60)),
+            "ERROR BAD_REQUEST")
+        self.assertEqual(self.server._handle_message(
+            "DEADLINE {} ID a STATUS".format(time.time() + 60)),
+            "OK ready=1")
+        self.assertIsNone(self.server._request_id)
+
+    def test_max_queue(self):
+        self.assertRaises(ValueError, Server, None, max_queue=0)
+
+    def test_profile(self):
+        """PROFILE samples for a bounded window, which STOP ends early"""
+
+        for signum in (signal.SIGUSR1, signal.SIGHUP):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        self.server.profile_dir = tempfile.mkdtemp()
+        self.server.prepare()
+
+        for seconds in ('soon', 'nan', 'inf', '-1', '0'):
+            self.assertEqual(self.server._handle_message(
+                "PROFILE {}".format(seconds)), "ERROR BAD_FORMAT")
+        self.assertEqual(self.server._handle_message("PROFILE STOP"),
+                         "ERROR NOT_PROFILING")
+
+        response = self.server._handle_message("PROFILE 1e9")
+        self.assertTrue(response.startswith("OK "), response)
+        path = response[3:]
+        self.assertTrue(self.server._handle_message(
+            "PROFILE 1").startswith("ERROR RUNTIME_ERROR"))
+
+        self.assertEqual(self.server._handle_message("PROFILE stop"),
+                         "OK {}".format(path))
+        self.assertTrue(os.path.exists(path))
+
+    def test_reload(self):
+        """RELOAD and SIGHUP swap in a new model and record statistics"""
+
+        swapped = Classifier.from_json({'trainingData': {
+            'positive': TWEETS['negative'], 'negative': TWEETS['positive']}})
+        self.server.loader = lambda path: swapped
+        score = self.server.classifier.score('amazing')
+
+        self.assertEqual(self.server._handle_message("RELOAD tweets.json"),
+                         "OK RELOADING tweets.json")
+        self.server._reload_thread.join()
+
+        self.assertIs(self.server.classifier, swapped)
+        self.assertEqual(self.server.source, 'tweets.json')
+        self.assertEqual(self.server.classifier.score('amazing'), -score)
+        self.assertEqual(self.server.last_reload['path'], 'tweets.json')
+        self.assertTrue(self.server.last_reload['seconds'] >= 0)
+        if os.path.exists('/proc/self/statm'):
+            self.assertTrue(self.server.last_reload['rss_loaded'] > 0)
+        self.assertTrue(self.server.last_reload['max_rss'] > 0)
+
+        self.server.classifier = None
+        self.server._handle_reload_signal(signal.SIGHUP, None)
+        self.server._reload_thread.join()
+        self.assertIs(self.server.classifier, swapped)
+
+    def test_max_input(self):
+        """Only the first max_input characters are scored"""
+
+        self.assertEqual(self.server._handle_message("GUESS " + "a " * 5 +
+                                                     "amazing"),
+                         "OK 0.0")
+
+
+class PipelineTestCase(TestCase):
+
+    def setUp(self):
+        classifier = Classifier.from_json({'trainingData': TWEETS})
+        self.server = Server(classifier)
+
+        directory = tempfile.mkdtemp(prefix='twentiment-')
+        self.context = zmq.Context()
+        self.producer = self.context.socket(zmq.PUSH)
+        self.producer.bind("ipc://{}/upstream".format(directory))
+        self.sink = self.context.socket(zmq.PULL)
+        self.sink.setsockopt(zmq.RCVTIMEO, 5000)
+        self.sink.bind("ipc://{}/downstream".format(directory))
+
+        self.pipeline = Pipeline(self.server,
+                                 "ipc://{}/upstream".format(directory),
+                                 "ipc://{}/downstream".format(directory))
+        self.pipeline.POLL_INTERVAL = 10
+        self.thread = threading.Thread(target=self.pipeline.run)
+        self.thread.start()
+
+    def tearDown(self):
+        self.pipeline.stop()
+        self.thread.join()
+        self.context.destroy(0)
+
+    def test_pipeline(self):
+        """Scores are pushed on with the tweet's id"""
+
+        tweets = {b'1': 'I love this view', b'x2': 'This car is horrible',
+                  b'3': ''}
+        for tweet_id, text in tweets.items():
+            self.producer.send(tweet_id + b' ' + text.encode('utf-8'))
+
+        results = dict(self.sink.recv().split(b' ') for _ in tweets)
+        self.assertEqual(results, {
+            tweet_id: self.server._guess(text).encode('ascii')
+            for (tweet_id, text) in tweets.items()})
+
+    def test_bad_message(self):
+        """Tweets that can't be scored get an error, scoring goes on"""
+
+        self.producer.send(b'1 \xff\xfe')
+        self.producer.send(b'2 I love this view')
+
+        self.assertEqual(self.sink.recv(), b'1 ERROR BAD_FORMAT')
+        self.assertEqual(self.sink.recv(), b'2 ' + self.server._guess(
+            'I love this view').encode('ascii'))
+
+
+class SlowLogTestCase(TestCase):
+
+    def setUp(self):
+        from twentiment.slowlog import SlowLog
+
+        classifier = Classifier.from_json({'trainingData': TWEETS})
+        self.path = os.path.join(tempfile.mkdtemp(), 'slow.log')
+        self.slow_log = SlowLog(self.path, threshold=0.0)
+        self.server = Server(classifier, slow_log=self.slow_log)
+
+    def tearDown(self):
+        self.slow_log.close()
+
+    def test_request_id(self):
+        self.assertEqual(self.server._handle_message("ID a1 GUESS amazing"),
+                         self.server._handle_message("GUESS amazing"))
+        self.assertEqual(self.server._handle_message("ID GUESS"),
+                         "ERROR BAD_FORMAT")
+
+    def test_slow_log(self):
+        """Slow requests are logged with their stages"""
+
+        self.server._handle_message("ID a1 GUESS I love this car")
+        self.slow_log.threshold = 60.0
+        self.server._handle_message("ID a2 GUESS I love this car")
+
+        with open(self.path) as log:
+            lines = log.readlines()
+
+        self.assertEqual(len(lines), 1)
+        fields = dict(field.split('=') for field in lines[0].split()
+                      if '=' in field)
+        self.assertEqual(fields['id'], 'a1')
+        self.assertEqual(fields['input'], '15')
+        self.assertEqual(fields['tokens'], '3')
+        for stage in ('normalize', 'features', 'classify'):
+            self.assertIn(stage + '_ms', fields)
+
+    def test_gc(self):
+        """Garbage collector runs during a request are counted"""
+
+        trace = self.slow_log.start(None, 0)
+        gc.collect()
+        self.slow_log.finish(trace)
+
+        with open(self.path) as log:
+            line = log.read()
+
+        self.assertIn(" id=- ", line)
+        self.assertNotIn(" gc=0 ", line)
@@ -0,0 +1,132 @@
+"""
+Tests for the sharded deployment mode.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import doctest
+import tempfile
+import threading
+from unittest import TestCase
+
+import zmq
+
+from twentiment import shard
+from twentiment.classifier import Classifier
+from twentiment.extract import extract_features
+from twentiment.naivebayes import NaiveBayesCounts
+from twentiment.text import normalize_text
+
+
+TWEETS = {
+    'positive': ['I love this car', 'This view is amazing',
+                 'He is my best friend'],
+    'negative': ['I do not like this car', 'This view is horrible',
+                 'He is my enemy'],
+}
+
+
+class ShardTestCase(TestCase):
+
+    def _train(self, **kwargs):
+        return Classifier.from_json({'trainingData': TWEETS}, **kwargs)
+
+    def test_doctests(self):
+        self.assertEqual(doctest.testmod(shard).failed, 0)
+
+    def test_parse(self):
+        self.assertEqual(shard.Shard.parse('1/4').index, 1)
+        self.assertRaises(ValueError, shard.Shard.parse, '4/4')
+        self.assertRaises(ValueError, shard.Shard.parse, 'foo')
+
+    def test_partial_sums(self):
+        """Partial scores of all shards add up to the full model's scores"""
+
+        full = self._train()
+        shards = [self._train(shard=shard.Shard(n, 3)) for n in range(3)]
+        featureset = extract_features(normalize_text(
+            "This car is my best friend and enemy, what a view"))
+
+        expected = full.feature_logprobs(featureset)
+        for label in expected:
+            total = sum(s.feature_logprobs(featureset)[label] for s in shards)
+            self.assertAlmostEqual(total, expected[label])
+            self.assertEqual(shards[0].label_logprobs()[label],
+                             full.label_logprobs()[label])
+
+    def test_shards_from_counts(self):
+        """Estimating a shard leaves the counts for the other shards"""
+
+        counts = NaiveBayesCounts()
+        counts.update((extract_features(normalize_text(text)), label)
+                      for (label, texts) in TWEETS.items()
+                      for text in texts)
+        keys = set(counts.feature_freqdist)
+
+        shards = [Classifier.from_counts(counts, shard=shard.Shard(n, 2))
+                  for n in range(2)]
+        self.assertEqual(set(counts.feature_freqdist), keys)
+
+        full = Classifier.from_counts(counts)
+        featureset = extract_features(normalize_text("my best friend's car"))
+        expected = full.feature_logprobs(featureset)
+        for label in expected:
+            self.assertAlmostEqual(
+                sum(s.feature_logprobs(featureset)[label] for s in shards),
+                expected[label])
+
+    def test_shard_server(self):
+        """Shard servers answer PARTIAL and PRIORS but not GUESS"""
+
+        server = shard.ShardServer(self._train(shard=shard.Shard(0, 1)))
+
+        partial = server._handle_message("PARTIAL car love")
+        self.assertTrue(partial.startswith("OK negative="), partial)
+        self.assertTrue(server._handle_message("PRIORS").startswith("OK "))
+        self.assertEqual(server._handle_message("GUESS car"),
+                         "ERROR UNKNOWN_COMMAND")
+
+
+class CoordinatorTestCase(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='twentiment-')
+        self.context = zmq.Context()
+
+        # Shard 0 answers, shard 1 accepts requests but never answers.
+        classifier = Classifier.from_json({'trainingData': TWEETS},
+                                          shard=shard.Shard(0, 2))
+        server = shard.ShardServer(classifier,
+                                   "ipc://{}/shard0".format(directory))
+        thread = threading.Thread(target=server.run)
+        thread.daemon = True
+        thread.start()
+
+        self.silent = self.context.socket(zmq.ROUTER)
+        self.silent.bind("ipc://{}/shard1".format(directory))
+
+        self.coordinator = shard.Coordinator(
+            ["ipc://{}/shard{}".format(directory, n) for n in range(2)],
+            timeout=0.2)
+
+    def tearDown(self):
+        self.context.destroy(0)
+
+    def test_unavailable_shard(self):
+        """A shard that doesn't answer only fails the request"""
+
+        owned = [word for word in ('love', 'car', 'view', 'friend', 'enemy')
+                 if shard.shard_of(word, 2) == 0]
+        self.assertTrue(self.coordinator._handle_message(
+            "GUESS " + ' '.join(owned)).startswith("OK "))
+
+        response = self.coordinator._handle_message(
+            "GUESS love car view friend enemy")
+        self.assertTrue(response.startswith(
+            "ERROR SHARD_UNAVAILABLE shard 1: timed out"), response)
+        self.assertIsNone(self.coordinator._priors)
+
+        self.assertTrue(self.coordinator._handle_message(
+            "GUESS " + ' '.join(owned)).startswith("OK "))
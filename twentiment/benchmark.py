@@ -0,0 +1,387 @@
+"""
+Benchmarks for choosing deployment parameters.
+
+The learning curve trains models on samples of increasing size, the same way
+``twentiment_server --entries`` does, and measures what each size buys in
+accuracy and costs in training time, memory and throughput.
+
+The client benchmark compares the request throughput of the clients in
+:mod:`twentiment.client` with plain REQ sockets, the pipeline benchmark
+measures the throughput of :class:`~twentiment.server.Pipeline` for a number
+of workers.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import resource
+import tempfile
+import itertools
+import threading
+import multiprocessing
+import zmq
+from twentiment.classifier import Classifier
+from twentiment.extract import extract_features
+from twentiment.ingest import read_training_data
+from twentiment.text import normalize_text
+
+
+#: The training pool and test set used by the worker processes, inherited
+#: through fork.
+_pool = None
+_test = None
+_seed = None
+
+
+def split_test_set(labeled_texts, test_size, seed=None):
+    """Shuffles ``labeled_texts`` and splits off ``test_size`` items as the
+    held-out test set. Returns the lists ``(pool, test)``.
+    """
+
+    items = list(labeled_texts)
+    random.Random(seed).shuffle(items)
+    return items[test_size:], items[:test_size]
+
+
+def _measure(size):
+    # The sample may be smaller than the size, e.g. if a label has fewer
+    # tweets, so the entries are taken from the final count of training.
+    entries = []
+
+    def progress(phase, count, vocabulary=None, final=False):
+        if phase == 'count' and final:
+            entries.append(count)
+
+    start = time.perf_counter()
+    classifier = Classifier.from_labeled_texts(_pool, max_entries=size,
+                                               seed=_seed, progress=progress)
+    train_seconds = time.perf_counter() - start
+
+    featuresets = [(extract_features(normalize_text(text)), label)
+                   for (text, label) in _test]
+    correct = sum(1 for (featureset, label) in featuresets
+                  if classifier.classify(featureset) == label)
+
+    # Throughput of the server's request handling, without the network.
+    from twentiment.server import Server
+    server = Server(classifier)
+    requests = ['GUESS ' + text for (text, _) in _test]
+    start = time.perf_counter()
+    for request in requests:
+        server._handle_message(request)
+    guess_seconds = time.perf_counter() - start
+
+    return {
+        'entries': entries[0],
+        'accuracy': correct / len(featuresets) if featuresets else None,
+        'train_seconds': train_seconds,
+        'model_bytes': classifier.memory_report()['total'],
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'guesses_per_second': (len(requests) / guess_seconds
+                               if guess_seconds else None),
+    }
+
+
+def learning_curve(labeled_texts, sizes, test_size=1000, seed=None,
+                   processes=None):
+    """Trains a model for each of ``sizes``, the ``max_entries`` passed to
+    :meth:`~twentiment.classifier.Classifier.from_labeled_texts` (0 for
+    all), and measures it on a held-out test set.
+
+    Every size is trained in its own process, so the memory measurements
+    don't influence each other, and up to ``processes`` of them in parallel.
+
+    :returns: A list with a dict of measurements for each size, see
+        :data:`COLUMNS`.
+    """
+
+    global _pool, _test, _seed
+    _pool, _test = split_test_set(labeled_texts, test_size, seed)
+    _seed = seed
+
+    context = multiprocessing.get_context('fork')
+    with context.Pool(processes, maxtasksperchild=1) as pool:
+        return pool.map(_measure, sizes, chunksize=1)
+
+
+#: The measurements of a learning curve point, with their table headings and
+#: formats.
+COLUMNS = (
+    ('entries', 'entries', '{:d}'),
+    ('accuracy', 'accuracy', '{:.4f}'),
+    ('train_seconds', 'train s', '{:.2f}'),
+    ('model_bytes', 'model MiB', '{:.1f}'),
+    ('max_rss_kib', 'max RSS MiB', '{:.1f}'),
+    ('guesses_per_second', 'guesses/s', '{:.0f}'),
+)
+
+
+def format_table(results):
+    """Formats the results of :func:`learning_curve` as a text table."""
+
+    def _cell(key, fmt, value):
+        if value is None:
+            return '-'
+        elif key == 'model_bytes':
+            value /= 2**20
+        elif key == 'max_rss_kib':
+            value /= 2**10
+        return fmt.format(value)
+
+    rows = [[heading for (_, heading, _) in COLUMNS]]
+    for result in results:
+        rows.append([_cell(key, fmt, result[key])
+                     for (key, _, fmt) in COLUMNS])
+
+    widths = [max(len(row[n]) for row in rows) for n in range(len(COLUMNS))]
+    return '\n'.join('  '.join(cell.rjust(width)
+                               for (cell, width) in zip(row, widths))
+                     for row in rows)
+
+
+def run_learning_curve(path, sizes, test_size=1000, seed=None,
+                       processes=None, out=None, json_path=None):
+    """Runs :func:`learning_curve` on the training data at ``path``, writes
+    the table to ``out`` and the results as JSON to ``json_path``.
+    """
+
+    out = out or sys.stdout
+    results = learning_curve(read_training_data(path), sizes, test_size,
+                             seed, processes)
+
+    print(format_table(results), file=out)
+    if json_path is not None:
+        with open(json_path, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    return results
+
+
+def _naive_socket_per_request(endpoint, messages):
+    context = zmq.Context.instance()
+    for message in messages:
+        socket = context.socket(zmq.REQ)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(endpoint)
+        socket.send_string(message)
+        socket.recv_string()
+        socket.close()
+
+
+def _naive_req_loop(endpoint, messages):
+    socket = zmq.Context.instance().socket(zmq.REQ)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.connect(endpoint)
+    for message in messages:
+        socket.send_string(message)
+        socket.recv_string()
+    socket.close()
+
+
+def _client_loop(endpoint, messages):
+    from twentiment.client import Client
+
+    with Client(endpoint) as client:
+        for message in messages:
+            client.request(message)
+
+
+def _client_many(endpoint, messages):
+    from twentiment.client import Client
+
+    with Client(endpoint) as client:
+        client.request_many(messages)
+
+
+def _async_client(endpoint, messages):
+    from twentiment.client import AsyncClient
+
+    async def run():
+        async with AsyncClient(endpoint) as client:
+            await asyncio.gather(*(client.request(message)
+                                   for message in messages))
+
+    asyncio.run(run())
+
+
+#: The ways of sending requests compared by :func:`client_throughput`.
+CLIENT_MODES = (
+    ('socket per request', _naive_socket_per_request),
+    ('REQ loop', _naive_req_loop),
+    ('Client.request', _client_loop),
+    ('Client.request_many', _client_many),
+    ('AsyncClient', _async_client),
+)
+
+
+def client_throughput(endpoint, texts, requests=10000):
+    """Sends ``requests`` guesses of ``texts`` to the server at ``endpoint``
+    in each of the :data:`CLIENT_MODES`.
+
+    :returns: A list of ``(mode, requests per second)`` tuples.
+    """
+
+    messages = ['GUESS ' + text for text in
+                itertools.islice(itertools.cycle(texts), requests)]
+
+    results = []
+    for mode, send in CLIENT_MODES:
+        start = time.perf_counter()
+        send(endpoint, messages)
+        results.append((mode, len(messages) / (time.perf_counter() - start)))
+
+    return results
+
+
+def _serve(path, bind):
+    from twentiment.server import Server
+
+    Server(Classifier.from_path(path), bind).run()
+
+
+def run_client_benchmark(path, endpoint="tcp://127.0.0.1:10001",
+                         requests=10000, serve=True, out=None):
+    """Runs :func:`client_throughput` with the tweets at ``path`` and writes
+    the results to ``out``. If ``serve`` is set, a server for a model trained
+    from ``path`` is started on ``endpoint`` for the duration of the
+    benchmark.
+    """
+
+    out = out or sys.stdout
+    texts = [text for (text, _) in itertools.islice(
+        read_training_data(path), requests)]
+
+    server = None
+    if serve:
+        from twentiment.client import Client
+
+        context = multiprocessing.get_context('fork')
+        server = context.Process(target=_serve, args=(path, endpoint))
+        server.daemon = True
+        server.start()
+        # Wait until the model is trained and the server answers.
+        with Client(endpoint, timeout=60.0, retries=0) as client:
+            client.request('GUESS ')
+
+    try:
+        results = client_throughput(endpoint, texts, requests)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    width = max(len(mode) for (mode, _) in results)
+    for mode, rate in results:
+        print('{}  {:8.0f} requests/s'.format(mode.ljust(width), rate),
+              file=out)
+
+    return results
+
+
+def _run_pipeline(classifier, upstream, downstream, workers):
+    from twentiment.server import Server, Pipeline
+
+    Pipeline(Server(classifier), upstream, downstream, workers).run()
+
+
+def pipeline_throughput(classifier, texts, messages=100000, workers=1):
+    """Streams ``messages`` tweets of ``texts`` through a
+    :class:`~twentiment.server.Pipeline` with ``workers`` processes, from a
+    synthetic producer to a sink in this process.
+
+    :returns: The number of tweets scored per second.
+    """
+
+    directory = tempfile.mkdtemp(prefix='twentiment-')
+    upstream = "ipc://{}".format(os.path.join(directory, 'upstream'))
+    downstream = "ipc://{}".format(os.path.join(directory, 'downstream'))
+
+    context = zmq.Context.instance()
+    producer = context.socket(zmq.PUSH)
+    producer.setsockopt(zmq.LINGER, 0)
+    producer.bind(upstream)
+    sink = context.socket(zmq.PULL)
+    sink.setsockopt(zmq.LINGER, 0)
+    sink.bind(downstream)
+
+    pipeline = multiprocessing.get_context('fork').Process(
+        target=_run_pipeline, args=(classifier, upstream, downstream,
+                                    workers))
+    pipeline.daemon = True
+    pipeline.start()
+
+    payload = [text.encode('utf-8') for text in texts]
+
+    def produce(count):
+        for n, text in zip(range(count), itertools.cycle(payload)):
+            producer.send(str(n).encode('ascii') + b' ' + text)
+
+    def consume(count):
+        for _ in range(count):
+            sink.recv()
+
+    try:
+        # Wait for every worker to connect, so the tweets are spread over
+        # all of them.
+        warmup = workers * 100
+        produce(warmup)
+        consume(warmup)
+        time.sleep(0.5)
+
+        start = time.perf_counter()
+        thread = threading.Thread(target=produce, args=(messages,))
+        thread.start()
+        consume(messages)
+        seconds = time.perf_counter() - start
+        thread.join()
+    finally:
+        pipeline.terminate()
+        pipeline.join()
+        producer.close()
+        sink.close()
+
+    return messages / seconds
+
+
+def scoring_throughput(classifier, texts, messages=100000):
+    """Returns the number of ``texts`` scored per second in this process,
+    without any messaging. The upper bound for a pipeline worker.
+    """
+
+    from twentiment.server import Server
+
+    guess = Server(classifier)._guess
+    start = time.perf_counter()
+    for _, text in zip(range(messages), itertools.cycle(texts)):
+        guess(text)
+    return messages / (time.perf_counter() - start)
+
+
+def run_pipeline_benchmark(path, workers=(1, 2, 4), messages=100000,
+                           out=None):
+    """Measures :func:`scoring_throughput` and :func:`pipeline_throughput`
+    for each number of ``workers`` with a model trained from ``path``, and
+    writes the results to ``out``.
+    """
+
+    out = out or sys.stdout
+    texts = [text for (text, _) in itertools.islice(
+        read_training_data(path), 10000)]
+    classifier = Classifier.from_path(path)
+
+    results = [('scoring only', scoring_throughput(classifier, texts,
+                                                   messages))]
+    print('{:<14}  {:8.0f} tweets/s'.format(*results[0]), file=out)
+    for count in workers:
+        mode = '{} worker{}'.format(count, '' if count == 1 else 's')
+        results.append((mode, pipeline_throughput(classifier, texts,
+                                                  messages, count)))
+        print('{:<14}  {:8.0f} tweets/s'.format(*results[-1]), file=out)
+
+    return results
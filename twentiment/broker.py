@@ -0,0 +1,295 @@
+"""
+A load-balancing broker in front of any number of twentiment servers.
+
+Clients connect to the broker's frontend exactly like to a single server.
+Servers run as :class:`Worker` instances, connect to the broker's backend and
+announce themselves. Each request is dispatched to the worker that has been
+idle the longest, so the throughput scales with the number of workers.
+
+Broker and workers exchange heartbeats. Workers may join at any time and
+leave either gracefully, by announcing it after finishing their current
+request, or by just disappearing, in which case the broker hands their
+in-flight request to another worker once the heartbeat expires. Either way no
+request is lost. Workers handle requests in a separate thread and keep
+sending heartbeats meanwhile, so a slow request isn't mistaken for a dead
+worker and answered twice.
+
+Backend protocol (frames after the ROUTER identity)::
+
+    worker -> broker: READY | HEARTBEAT | DISCONNECT
+    worker -> broker: REPLY [envelope...] [response]
+    broker -> worker: HEARTBEAT
+    broker -> worker: REQUEST [envelope...] [request]
+
+The envelope holds the client's routing frames and is passed through
+untouched.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import time
+import queue
+import signal
+import threading
+from collections import OrderedDict, deque
+import zmq
+
+
+READY = b'READY'
+HEARTBEAT = b'HEARTBEAT'
+DISCONNECT = b'DISCONNECT'
+REQUEST = b'REQUEST'
+REPLY = b'REPLY'
+
+
+class Broker:
+    """Dispatches client requests to idle workers."""
+
+    def __init__(self, frontend="tcp://127.0.0.1:10001",
+                 backend="tcp://127.0.0.1:10002", heartbeat=1.0, liveness=3):
+        """
+        :param frontend: Bind for the clients.
+        :param backend: Bind for the workers.
+        :param heartbeat: Seconds between two heartbeats.
+        :param liveness: Number of missed heartbeats after which a worker is
+            considered dead.
+        """
+
+        self.frontend = frontend
+        self.backend = backend
+        self.heartbeat = heartbeat
+        self.liveness = liveness
+        #: Idle workers, least recently used first, mapping to their expiry.
+        self._idle = OrderedDict()
+        #: Busy workers mapping to their expiry and current request.
+        self._busy = {}
+        #: Requests of workers that died while processing them.
+        self._requeued = deque()
+        self._stopping = False
+
+    def stop(self):
+        """Stops the broker after the current round of its loop."""
+
+        self._stopping = True
+
+    def _expiry(self):
+        return time.monotonic() + self.heartbeat * self.liveness
+
+    def run(self, tick=None):
+        """Starts a blocking broker, which runs until :meth:`stop` is called.
+
+        :param tick: A callable invoked on every round of the loop, at least
+            once per heartbeat, e.g. for supervising the workers.
+        """
+
+        context = zmq.Context()
+        frontend = context.socket(zmq.ROUTER)
+        backend = context.socket(zmq.ROUTER)
+        frontend.bind(self.frontend)
+        backend.bind(self.backend)
+
+        print("Starting broker on {} (workers on {})".format(self.frontend,
+                                                             self.backend))
+        next_heartbeat = time.monotonic() + self.heartbeat
+        while not self._stopping:
+            self._dispatch_requeued(backend)
+
+            poller = zmq.Poller()
+            poller.register(backend, zmq.POLLIN)
+            # Only accept new requests when they can be handed out right
+            # away. Everything else is queued by ZeroMQ.
+            if self._idle:
+                poller.register(frontend, zmq.POLLIN)
+
+            events = dict(poller.poll(self.heartbeat * 1000))
+
+            if backend in events:
+                self._handle_backend(backend.recv_multipart(), frontend)
+
+            if frontend in events and self._idle:
+                self._dispatch(backend, frontend.recv_multipart())
+
+            if time.monotonic() >= next_heartbeat:
+                for worker in self._idle:
+                    backend.send_multipart([worker, HEARTBEAT])
+                next_heartbeat = time.monotonic() + self.heartbeat
+
+            self._purge()
+
+            if tick is not None:
+                tick()
+
+        frontend.close(0)
+        backend.close(0)
+        context.term()
+
+    def _handle_backend(self, frames, frontend):
+        worker, command, rest = frames[0], frames[1], frames[2:]
+
+        if command == REPLY:
+            frontend.send_multipart(rest)
+            self._busy.pop(worker, None)
+            self._idle[worker] = self._expiry()
+        elif command == DISCONNECT:
+            self._idle.pop(worker, None)
+            busy = self._busy.pop(worker, None)
+            if busy is not None:
+                self._requeued.append(busy[1])
+        elif worker in self._busy:
+            # Heartbeat of a worker that is still processing a request.
+            self._busy[worker] = (self._expiry(), self._busy[worker][1])
+        else:
+            # READY, or a heartbeat from a worker we don't know yet, e.g.
+            # after the broker was restarted.
+            self._idle.pop(worker, None)
+            self._idle[worker] = self._expiry()
+
+    def _dispatch(self, backend, request):
+        worker, _ = self._idle.popitem(last=False)
+        self._busy[worker] = (self._expiry(), request)
+        backend.send_multipart([worker, REQUEST] + request)
+
+    def _dispatch_requeued(self, backend):
+        while self._requeued and self._idle:
+            self._dispatch(backend, self._requeued.popleft())
+
+    def _purge(self):
+        now = time.monotonic()
+
+        for worker, expiry in list(self._idle.items()):
+            if expiry < now:
+                del self._idle[worker]
+
+        for worker, (expiry, request) in list(self._busy.items()):
+            if expiry < now:
+                del self._busy[worker]
+                self._requeued.append(request)
+
+
+class Worker:
+    """Serves requests handed out by a :class:`Broker` with a
+    :class:`~twentiment.server.Server`'s command handling.
+    """
+
+    def __init__(self, server, broker="tcp://127.0.0.1:10002", heartbeat=1.0,
+                 liveness=3):
+        """
+        :param server: The server handling the requests.
+        :param broker: Endpoint of the broker's backend.
+        :param heartbeat: Seconds between two heartbeats, must match the
+            broker's.
+        :param liveness: Number of missed heartbeats after which the worker
+            reconnects to the broker.
+        """
+
+        self.server = server
+        self.broker = broker
+        self.heartbeat = heartbeat
+        self.liveness = liveness
+        self._stopping = False
+
+    def stop(self, *args):
+        """Leaves the broker after the current request has been answered."""
+
+        self._stopping = True
+
+    def _connect(self, context):
+        socket = context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 1000)
+        socket.connect(self.broker)
+        socket.send(READY)
+        return socket
+
+    def run(self):
+        """Starts serving requests until :meth:`stop` is called or the process
+        receives ``SIGTERM`` or ``SIGINT``.
+        """
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        # Requests are handled in a thread of their own, which hands the
+        # replies back over an inproc socket, as ZeroMQ sockets must not be
+        # shared between threads.
+        context = zmq.Context()
+        endpoint = "inproc://twentiment-worker-{}".format(id(self))
+        replies = context.socket(zmq.PAIR)
+        replies.bind(endpoint)
+        requests = queue.Queue()
+        handler = threading.Thread(target=self._serve,
+                                   args=(context, endpoint, requests),
+                                   name='twentiment-worker')
+        handler.daemon = True
+        handler.start()
+        self.server.prepare(handler.ident)
+
+        socket = self._connect(context)
+
+        print("Serving requests from broker {}".format(self.broker))
+        busy = False
+        expiry = time.monotonic() + self.heartbeat * self.liveness
+        next_heartbeat = time.monotonic() + self.heartbeat
+        while busy or not self._stopping:
+            poller = zmq.Poller()
+            poller.register(socket, zmq.POLLIN)
+            poller.register(replies, zmq.POLLIN)
+            try:
+                events = dict(poller.poll(self.heartbeat * 1000))
+            except zmq.ZMQError:
+                # Interrupted by a signal, check whether to stop.
+                continue
+
+            if replies in events:
+                socket.send_multipart(replies.recv_multipart())
+                busy = False
+
+            if socket in events:
+                frames = socket.recv_multipart()
+                expiry = time.monotonic() + self.heartbeat * self.liveness
+
+                if frames[0] == REQUEST:
+                    requests.put(frames[1:])
+                    busy = True
+            elif not busy and time.monotonic() > expiry:
+                # The broker is gone, reconnect with a fresh socket. The
+                # broker only sends heartbeats to idle workers, so this can
+                # only be told while idle.
+                socket.close(0)
+                socket = self._connect(context)
+                expiry = time.monotonic() + self.heartbeat * self.liveness
+
+            if time.monotonic() >= next_heartbeat:
+                socket.send(HEARTBEAT)
+                next_heartbeat = time.monotonic() + self.heartbeat
+
+        socket.send(DISCONNECT)
+        socket.close()
+        requests.put(None)
+        handler.join()
+        replies.close()
+        context.term()
+
+    def _serve(self, context, endpoint, requests):
+        replies = context.socket(zmq.PAIR)
+        replies.connect(endpoint)
+
+        for frames in iter(requests.get, None):
+            replies.send_multipart(self._handle(frames))
+
+        replies.close()
+
+    def _handle(self, frames):
+        envelope, message = frames[:-1], frames[-1]
+        try:
+            response = self.server._handle_message(str(message, "utf-8"))
+        except Exception as err:
+            response = self.server._error_response("RUNTIME_ERROR " +
+                                                   str(err))
+
+        if response is None:
+            # The worker must answer so the broker knows it is idle again.
+            response = self.server._error_response("DEADLINE_EXCEEDED")
+
+        return [REPLY] + envelope + [response.encode('utf-8')]
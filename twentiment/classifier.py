@@ -6,22 +6,26 @@ supports persistance and loading training data from the file system.
 :license: Apache 2
 """
 
+import os
 import json
-from twentiment.naivebayes import NaiveBayesClassifier
+import itertools
 from twentiment.extract import extract_features
 from twentiment.text import normalize_text
+from twentiment.sampling import stratified_reservoir
+from twentiment.profiling import optional_phase, tracked
 
 
-def _extract_documents(tweets, label):
-    return [(normalize_text(tweet), label) for tweet in tweets]
-
-
-def _limited_tweet_split(json, limit=0):
+def _limited_tweet_split(json, limit=0, seed=None):
     data = json['trainingData']
     positive, negative = data['positive'], data['negative']
 
     if limit > 1:
-        return positive[:limit // 2], negative[:limit // 2]
+        # Sample uniformly from each label instead of taking the head of the
+        # lists, which would be biased by the order of the input file.
+        sample = stratified_reservoir(itertools.chain(
+            ((tweet, 'positive') for tweet in positive),
+            ((tweet, 'negative') for tweet in negative)), limit // 2, seed)
+        return sample.get('positive', []), sample.get('negative', [])
     else:
         return positive, negative
 
@@ -44,40 +48,265 @@ class Classifier:
             return lambda *a, **kw: getattr(self.classifier, method)(*a, **kw)
 
         # Proxy some methods to the classifier
-        for method in ['prob_classify', 'classify']:
+        for method in ['prob_classify', 'classify', 'label_logprobs',
+                       'feature_logprobs']:
             setattr(self, method, _proxy_classifier_method(method))
             setattr(getattr(self, method), '__doc__',
                     getattr(self.classifier, method).__doc__)
 
+    def memory_report(self):
+        """Returns an ordered dict breaking down the memory used by the
+        model in bytes. See :func:`twentiment.memory.naive_bayes_report` for
+        the categories.
+        """
+
+        from twentiment.memory import model_report
+        return model_report(self.classifier)
+
+    def compact(self):
+        """Returns a new instance wrapping a compact copy of the trained
+        model, see
+        :class:`~twentiment.naivebayes.CompactNaiveBayesClassifier`.
+        """
+
+        return self.__class__(self.classifier.compact())
+
+    def score(self, text, trace=None):
+        """Returns the sentiment of ``text`` as the difference between the
+        probabilities of the positive and the negative label, i.e. a value
+        between -1 (negative) and 1 (positive).
+
+        :param trace: A :class:`~twentiment.slowlog.Trace` to record the
+            durations of the stages and the number of tokens in.
+        """
+
+        if trace is None:
+            result = self.prob_classify(extract_features(normalize_text(text)))
+            return result.prob('positive') - result.prob('negative')
+
+        tokens = normalize_text(text)
+        trace.tokens = len(tokens)
+        trace.mark('normalize')
+        featureset = extract_features(tokens)
+        trace.mark('features')
+        result = self.prob_classify(featureset)
+        score = result.prob('positive') - result.prob('negative')
+        trace.mark('classify')
+        return score
+
     @classmethod
     def from_file(cls, file, *args, **kwargs):
         """Creates a new instance from the given file handle."""
 
-        return cls.from_json(json.load(file), *args, **kwargs)
+        progress = kwargs.get('progress')
+        if progress is not None:
+            progress('parse', 0)
+
+        with optional_phase(kwargs.get('timer'), 'parse'):
+            data = json.load(file)
+
+        if progress is not None:
+            progress('parse', sum(len(tweets) for tweets
+                                  in data['trainingData'].values()),
+                     final=True)
+
+        return cls.from_json(data, *args, **kwargs)
+
+    @classmethod
+    def from_path(cls, path, max_entries=0, seed=None, processes=None,
+                  **kwargs):
+        """Creates a new instance from the file at ``path``. Files ending in
+        ``.jsonl`` or ``.tsv`` are streamed line by line (see
+        :mod:`twentiment.ingest`), files ending in ``.counts`` hold the counts
+        saved by an earlier training run (see :meth:`from_counts`), everything
+        else is read as a JSON document.
+
+        :param processes: Featurize line-delimited files across this many
+            processes. Only used if ``max_entries`` is not set.
+        :raises ValueError: If ``max_entries`` is given for a ``.counts``
+            file, which can't be subsampled.
+
+        Further keyword arguments are passed on to :meth:`from_training_set`.
+        """
+
+        from twentiment import ingest
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.counts':
+            from twentiment.naivebayes import NaiveBayesCounts
+
+            # The counts are already saved, and can't be subsampled.
+            if max_entries > 1:
+                raise ValueError("Can't sample {} entries from the counts in "
+                                 "{}".format(max_entries, path))
+            kwargs.pop('save_counts', None)
+            with optional_phase(kwargs.get('timer'), 'load counts'):
+                with open(path, 'r') as file:
+                    counts = NaiveBayesCounts.load(file)
+
+            return cls.from_counts(counts, consume=True, **kwargs)
+
+        if extension in ingest.READERS:
+            if processes and max_entries <= 1:
+                return cls.from_training_set(
+                    ingest.parallel_featuresets(path, processes), **kwargs)
+
+            return cls.from_labeled_texts(ingest.read_labeled_texts(path),
+                                          max_entries, seed, **kwargs)
+
+        with open(path, 'r') as file:
+            return cls.from_file(file, max_entries=max_entries, seed=seed,
+                                 **kwargs)
 
     @classmethod
-    def from_json(cls, json, max_entries=0):
+    def from_json(cls, json, max_entries=0, seed=None, timer=None,
+                  progress=None, **kwargs):
         """Creates a new instance from the given JSON data as dict data
         structure.
 
         :param max_entries: Limit training set to a maximum of ``max_entries``
             items. This can be helpful to reduce memory usage. A value of 0 or
             less means no limit.
+        :param seed: Seed used to randomly pick the ``max_entries`` items.
+        :param timer: A :class:`~twentiment.profiling.PhaseTimer` recording
+            the duration, and optionally the peak memory, of each phase.
+        :param progress: A :class:`~twentiment.profiling.Progress` reporting
+            the number of documents processed while training.
+
+        Further keyword arguments are passed on to :meth:`from_training_set`.
+        """
+
+        with optional_phase(timer, 'split'):
+            pos_tweets, neg_tweets = _limited_tweet_split(json, max_entries,
+                                                          seed)
+
+        # The tweets flow through normalizing, featurizing and counting one
+        # at a time, so besides the counts only the features of the current
+        # tweet are held in memory. As the steps are interleaved, their time
+        # is recorded as part of the count phase.
+        labeled_tweets = itertools.chain(
+            ((tweet, 'positive') for tweet in pos_tweets),
+            ((tweet, 'negative') for tweet in neg_tweets))
+        documents = ((normalize_text(tweet), label) for (tweet, label)
+                     in tracked(labeled_tweets, progress, 'normalize'))
+        training_set = ((extract_features(doc), label) for (doc, label)
+                        in tracked(documents, progress, 'featurize'))
+
+        return cls.from_training_set(training_set, timer=timer,
+                                     progress=progress, **kwargs)
+
+    @classmethod
+    def from_labeled_texts(cls, labeled_texts, max_entries=0, seed=None,
+                           **kwargs):
+        """Creates a new instance from an iterable of ``(text, label)``
+        tuples. The texts are normalized and featurized one at a time while
+        training, so the iterable may be a stream.
+
+        :param max_entries: Train on a random sample of at most
+            ``max_entries`` items, split evenly across labels.
+        :param seed: Seed used to randomly pick the ``max_entries`` items.
+
+        Further keyword arguments are passed on to :meth:`from_training_set`.
+        """
+
+        if max_entries > 1:
+            sample = stratified_reservoir(labeled_texts, max_entries // 2,
+                                          seed)
+            labeled_texts = ((text, label) for (label, texts) in sample.items()
+                             for text in texts)
+
+        training_set = ((extract_features(normalize_text(text)), label)
+                        for (text, label) in labeled_texts)
+
+        return cls.from_training_set(training_set, **kwargs)
+
+    @classmethod
+    def from_training_set(cls, training_set, shard=None, timer=None,
+                          save_counts=None, progress=None, **kwargs):
+        """Creates a new instance from the given training set.
+
+        :param shard: A :class:`~twentiment.shard.Shard`. If given, only the
+            features belonging to that shard are trained on.
+        :param timer: A :class:`~twentiment.profiling.PhaseTimer` recording
+            the training phases.
+        :param save_counts: Path to save the counts of the training set to,
+            so later runs can load them instead of the training set.
+        :param progress: A :class:`~twentiment.profiling.Progress` reporting
+            the training phases.
+
+        Further keyword arguments are passed on to :meth:`from_counts`.
         """
 
-        pos_tweets, neg_tweets = _limited_tweet_split(json, max_entries)
+        # Imported here so that merely importing this module (e.g. from the
+        # server entry point) does not pull in the probability module.
+        from twentiment.naivebayes import NaiveBayesCounts
+
+        if shard is not None:
+            training_set = shard.filter(training_set)
 
-        tweets = (_extract_documents(pos_tweets, 'positive') +
-                  _extract_documents(neg_tweets, 'negative'))
+        with optional_phase(timer, 'count'):
+            counts = NaiveBayesCounts()
+            counts.update(training_set, progress)
 
-        training_set = [(extract_features(doc), label) for (doc, label)
-                        in tweets]
+        if save_counts is not None:
+            with optional_phase(timer, 'save counts'):
+                with open(save_counts, 'w') as file:
+                    counts.dump(file)
 
-        return cls.from_training_set(training_set)
+        return cls.from_counts(counts, timer=timer, progress=progress,
+                               consume=True, **kwargs)
 
     @classmethod
-    def from_training_set(cls, training_set):
-        """Creates a new instance from the given training set."""
+    def from_counts(cls, counts, shard=None, timer=None, compact=False,
+                    estimator='ele', precompute=False, progress=None,
+                    consume=False):
+        """Creates a new instance from the counts of a training set, a
+        :class:`~twentiment.naivebayes.NaiveBayesCounts` instance.
+
+        :param shard: A :class:`~twentiment.shard.Shard`. If given, only the
+            counts of the features belonging to that shard are estimated.
+        :param timer: A :class:`~twentiment.profiling.PhaseTimer` recording
+            the estimation phase.
+        :param compact: Convert the trained model into its compact
+            representation.
+        :param estimator: Name of the smoothing estimator, one of
+            :data:`twentiment.naivebayes.ESTIMATORS`.
+        :param precompute: Turn the estimated probabilities into lookup
+            tables, which speeds up classifying with the more expensive
+            estimators.
+        :param progress: A :class:`~twentiment.profiling.Progress` reporting
+            the estimation phases.
+        :param consume: Move the counts into the model instead of copying
+            them, see
+            :meth:`~twentiment.naivebayes.NaiveBayesClassifier.estimate`.
+            Otherwise ``counts`` is left untouched.
+        """
+
+        from twentiment.naivebayes import (NaiveBayesClassifier,
+                                           NaiveBayesCounts, ESTIMATORS)
+
+        if shard is not None and consume:
+            # The counts are given up anyway, drop the other shards' right
+            # away.
+            for key in list(counts.feature_freqdist):
+                if not shard.owns(key[1]):
+                    del counts.feature_freqdist[key]
+        elif shard is not None:
+            # Only the mapping is copied, estimating copies the distributions
+            # it uses.
+            owned = NaiveBayesCounts()
+            owned.label_freqdist = counts.label_freqdist
+            owned.feature_freqdist.update(
+                (key, freqdist) for (key, freqdist)
+                in counts.feature_freqdist.items() if shard.owns(key[1]))
+            counts = owned
+
+        with optional_phase(timer, 'estimate'):
+            classifier = NaiveBayesClassifier.estimate(
+                counts, ESTIMATORS[estimator], precompute, progress, consume)
+
+        if compact:
+            with optional_phase(timer, 'compact'):
+                classifier = classifier.compact()
 
-        classifier = NaiveBayesClassifier.train(training_set)
         return cls(classifier)
@@ -0,0 +1,344 @@
+"""
+Clients for the twentiment server, usable from threads and from asyncio.
+
+Both clients talk to the server through DEALER sockets and prefix every
+request with a correlation frame. The server's ROUTER socket hands all frames
+but the last one back untouched, so replies can be matched to their requests
+even if several are in flight, and the same works through a
+:class:`~twentiment.broker.Broker`, whose workers may answer out of order.
+
+A request that isn't answered within the timeout is sent again on a fresh
+socket, as the old connection may be stuck on a server that went away.
+Replies that arrive late are recognised by their correlation frame and
+ignored.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import asyncio
+import itertools
+import threading
+import zmq
+
+
+class ServerError(Exception):
+    """The server answered with ``ERROR``. :attr:`code` holds the error code,
+    e.g. ``OVERLOADED``.
+    """
+
+    def __init__(self, response):
+        super().__init__(response)
+        self.code = response.split(" ")[1] if " " in response else response
+
+
+def parse_guess(response):
+    """Returns the score of a ``GUESS`` response.
+
+    :raises ServerError: If the server answered with an error.
+    """
+
+    status, _, value = response.partition(" ")
+    if status != "OK":
+        raise ServerError(response)
+
+    return float(value)
+
+
+class Client:
+    """A thread-safe client keeping a pool of connections to the server.
+
+    Every thread takes a socket out of the pool for the duration of a call
+    and puts it back afterwards, so sockets are reused instead of connecting
+    for every request, and never shared between threads at the same time.
+    """
+
+    def __init__(self, endpoint="tcp://127.0.0.1:10001", timeout=5.0,
+                 retries=2, window=500, context=None):
+        """
+        :param endpoint: Endpoint of the server or broker.
+        :param timeout: Seconds to wait for a reply before retrying.
+        :param retries: Number of times a request is retried before giving up
+            with a :class:`TimeoutError`.
+        :param window: Maximum number of requests :meth:`guess_many` keeps in
+            flight. Keep it below the server's high-water mark.
+        :param context: The ZeroMQ context, defaults to the global instance.
+        """
+
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.retries = retries
+        self.window = window
+        self._context = context or zmq.Context.instance()
+        self._sockets = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _next_id(self):
+        # itertools.count is atomic under the GIL.
+        return str(next(self._ids)).encode('ascii')
+
+    def _acquire(self):
+        with self._lock:
+            if self._sockets:
+                return self._sockets.pop()
+
+        socket = self._context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.RCVTIMEO, int(self.timeout * 1000))
+        socket.connect(self.endpoint)
+        return socket
+
+    def _release(self, socket):
+        with self._lock:
+            self._sockets.append(socket)
+
+    def close(self):
+        """Closes all pooled connections."""
+
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+
+        for socket in sockets:
+            socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, message):
+        """Sends the raw request ``message``, e.g. ``"MEMORY"``, and returns
+        the raw response.
+
+        :raises TimeoutError: If no reply arrived after all retries.
+        """
+
+        message = message.encode('utf-8')
+        for _ in range(self.retries + 1):
+            socket = self._acquire()
+            request_id = self._next_id()
+            try:
+                socket.send_multipart([request_id, message])
+                while True:
+                    reply_id, response = socket.recv_multipart()
+                    # Skip late replies to requests of earlier calls.
+                    if reply_id == request_id:
+                        self._release(socket)
+                        return str(response, 'utf-8')
+            except zmq.Again:
+                socket.close()
+            except BaseException:
+                socket.close()
+                raise
+
+        raise TimeoutError("Request to {} timed out".format(self.endpoint))
+
+    def request_many(self, messages):
+        """Sends all ``messages``, keeping up to :attr:`window` of them in
+        flight on one connection, and returns the responses in the same
+        order.
+
+        :raises TimeoutError: If some replies didn't arrive after all
+            retries.
+        """
+
+        responses = [None] * len(messages)
+        pending = list(range(len(messages)))
+
+        for _ in range(self.retries + 1):
+            socket = self._acquire()
+            try:
+                pending = self._exchange(socket, messages, pending,
+                                         responses)
+            except BaseException:
+                socket.close()
+                raise
+
+            if pending:
+                # Whatever is stuck on this connection, don't reuse it.
+                socket.close()
+            else:
+                self._release(socket)
+                return responses
+
+        raise TimeoutError("{} of {} requests to {} timed out".format(
+            len(pending), len(messages), self.endpoint))
+
+    def _exchange(self, socket, messages, pending, responses):
+        """Sends the ``pending`` indices of ``messages`` over ``socket`` and
+        fills in their ``responses``. Returns the indices that timed out.
+        """
+
+        queued = iter(pending)
+        in_flight = {}
+
+        def send_next():
+            index = next(queued, None)
+            if index is not None:
+                request_id = self._next_id()
+                in_flight[request_id] = index
+                socket.send_multipart([request_id,
+                                       messages[index].encode('utf-8')])
+
+        for _ in range(self.window):
+            send_next()
+
+        # The receive timeout applies to each reply rather than the whole
+        # batch, as every reply shows the server is alive.
+        while in_flight:
+            try:
+                request_id, response = socket.recv_multipart()
+            except zmq.Again:
+                break
+
+            index = in_flight.pop(request_id, None)
+            if index is None:
+                # A late reply to a request of an earlier call.
+                continue
+
+            responses[index] = str(response, 'utf-8')
+            send_next()
+
+        return sorted(in_flight.values()) + list(queued)
+
+    def guess(self, text):
+        """Returns the sentiment score of ``text``.
+
+        :raises ServerError: If the server answered with an error.
+        :raises TimeoutError: If the server didn't answer.
+        """
+
+        return parse_guess(self.request("GUESS " + text))
+
+    def guess_many(self, texts):
+        """Returns the sentiment scores of all ``texts``, pipelining the
+        requests over one connection.
+        """
+
+        return [parse_guess(response) for response in
+                self.request_many(["GUESS " + text for text in texts])]
+
+
+def _expire(future):
+    if not future.done():
+        future.set_exception(TimeoutError())
+
+
+class AsyncClient:
+    """An asyncio client keeping many requests in flight on one connection.
+
+    Must be created and used from within the same running event loop.
+    """
+
+    def __init__(self, endpoint="tcp://127.0.0.1:10001", timeout=5.0,
+                 retries=2, window=500, context=None):
+        """
+        :param endpoint: Endpoint of the server or broker.
+        :param timeout: Seconds to wait for a reply before retrying.
+        :param retries: Number of times a request is retried before giving up
+            with a :class:`TimeoutError`.
+        :param window: Maximum number of requests in flight.
+        :param context: A :class:`zmq.asyncio.Context`, defaults to a new
+            one, which :meth:`close` terminates.
+        """
+
+        import zmq.asyncio
+
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.retries = retries
+        self._owns_context = context is None
+        self._context = context or zmq.asyncio.Context()
+        self._window = asyncio.Semaphore(window)
+        self._ids = itertools.count()
+        self._futures = {}
+        self._socket = None
+        self._reader = None
+
+    def _connect(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._socket is not None:
+            self._socket.close()
+
+        self._socket = self._context.socket(zmq.DEALER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.connect(self.endpoint)
+        self._reader = asyncio.ensure_future(self._read(self._socket))
+
+    async def _read(self, socket):
+        while True:
+            request_id, response = await socket.recv_multipart()
+            future = self._futures.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(str(response, 'utf-8'))
+
+    def close(self):
+        """Closes the connection, and the context if the client created it.
+        """
+
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self._owns_context:
+            self._context.term()
+            self._owns_context = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def request(self, message):
+        """Sends the raw request ``message`` and returns the raw response.
+
+        :raises TimeoutError: If no reply arrived after all retries.
+        """
+
+        async with self._window:
+            for _ in range(self.retries + 1):
+                if self._socket is None:
+                    self._connect()
+
+                socket = self._socket
+                request_id = str(next(self._ids)).encode('ascii')
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self._futures[request_id] = future
+                await socket.send_multipart([request_id,
+                                             message.encode('utf-8')])
+
+                # Cheaper than asyncio.wait_for, which wraps the future in a
+                # task.
+                timer = loop.call_later(self.timeout, _expire, future)
+                try:
+                    return await future
+                except TimeoutError:
+                    self._futures.pop(request_id, None)
+                finally:
+                    timer.cancel()
+
+                # Reconnect, unless another request did so already.
+                if socket is self._socket:
+                    self._connect()
+
+        raise TimeoutError("Request to {} timed out".format(self.endpoint))
+
+    async def guess(self, text):
+        """Returns the sentiment score of ``text``, see
+        :meth:`Client.guess`.
+        """
+
+        return parse_guess(await self.request("GUESS " + text))
+
+    async def guess_many(self, texts):
+        """Returns the sentiment scores of all ``texts``, sent concurrently.
+        """
+
+        return await asyncio.gather(*(self.guess(text) for text in texts))
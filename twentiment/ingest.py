@@ -0,0 +1,228 @@
+"""
+Streaming ingestion of line-delimited training data.
+
+Two formats are supported, both with one labeled tweet per line:
+
+* JSON Lines (``.jsonl``): ``{"text": "I love this car", "label": "positive"}``
+* Tab separated values (``.tsv``): ``positive<TAB>I love this car``
+
+Unlike the single JSON document read by
+:meth:`~twentiment.classifier.Classifier.from_file`, these files can be
+appended to, concatenated and split at arbitrary line boundaries, so a large
+file can be processed in byte ranges by several processes at once.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import json
+import itertools
+import multiprocessing
+from collections import deque
+from twentiment.extract import extract_features
+from twentiment.text import normalize_text
+
+
+def read_jsonl(lines):
+    """Yields ``(text, label)`` tuples from lines of JSON objects. Blank lines
+    are skipped.
+
+    >>> list(read_jsonl(['{"text": "so good", "label": "positive"}', '']))
+    [('so good', 'positive')]
+
+    :raises ValueError: For a line that isn't an object with a string
+        ``text`` and ``label``.
+    """
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        record = json.loads(line)
+        try:
+            text, label = record['text'], record['label']
+        except (KeyError, TypeError):
+            text = label = None
+        if not isinstance(text, str) or not isinstance(label, str):
+            raise ValueError("Expected an object with a text and a label")
+
+        yield text, label
+
+
+def read_tsv(lines):
+    """Yields ``(text, label)`` tuples from ``label<TAB>text`` lines. Blank
+    lines are skipped.
+
+    >>> list(read_tsv(['negative\\tso bad\\n']))
+    [('so bad', 'negative')]
+
+    :raises ValueError: For a line without a tab.
+    """
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+
+        label, tab, text = line.partition('\t')
+        if not tab:
+            raise ValueError("Expected a label and a text separated by a tab")
+
+        yield text, label
+
+
+#: Maps file extensions to the reader for that format.
+READERS = {
+    '.jsonl': read_jsonl,
+    '.tsv': read_tsv,
+}
+
+
+def reader_for(path):
+    """Returns the reader function for the format of ``path``, determined by
+    its extension.
+
+    :raises ValueError: If the format is not supported.
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        return READERS[ext]
+    except KeyError:
+        raise ValueError("Unsupported training data format: {}".format(path))
+
+
+def byte_ranges(path, parts):
+    """Splits the file at ``path`` into ``parts`` byte ranges of roughly equal
+    size. The ranges don't need to be aligned to lines, :func:`read_range`
+    takes care of that.
+
+    :returns: A list of ``(start, end)`` tuples.
+    """
+
+    size = os.path.getsize(path)
+    parts = max(1, min(parts, size))
+    bounds = [size * n // parts for n in range(parts + 1)]
+
+    return list(zip(bounds, bounds[1:]))
+
+
+def read_range(path, start, end, encoding='utf-8'):
+    """Yields the decoded lines of ``path`` that *start* within the byte range
+    ``[start, end)``. Reading all ranges returned by :func:`byte_ranges`
+    yields every line exactly once.
+
+    :param encoding: The encoding of the file. ``None`` yields the lines
+        as bytes, for callers that deal with undecodable lines themselves.
+    """
+
+    for _, line in _read_lines(path, start, end):
+        yield line if encoding is None else line.decode(encoding)
+
+
+def _read_lines(path, start, end):
+    """Like :func:`read_range`, but yields ``(offset, line)`` tuples of
+    undecoded lines.
+    """
+
+    with open(path, 'rb') as file:
+        if start > 0:
+            # Skip the line that started in the previous range. Seeking one
+            # byte back makes sure a line starting exactly at ``start`` is
+            # not skipped.
+            file.seek(start - 1)
+            file.readline()
+
+        while file.tell() < end:
+            offset = file.tell()
+            line = file.readline()
+            if not line:
+                break
+
+            yield offset, line
+
+
+def read_labeled_texts(path, start=0, end=None):
+    """Yields ``(text, label)`` tuples from the given byte range of a JSONL or
+    TSV file, which defaults to the whole file.
+
+    :raises ValueError: For a malformed line, naming the file and the byte
+        offset of the line.
+    """
+
+    if end is None:
+        end = os.path.getsize(path)
+
+    reader = reader_for(path)
+    # The readers take one line at a time, so the offset of the line they
+    # fail on is the last one handed out.
+    current = [start]
+
+    def lines():
+        for offset, line in _read_lines(path, start, end):
+            current[0] = offset
+            yield line.decode('utf-8')
+
+    try:
+        yield from reader(lines())
+    except ValueError as err:
+        raise ValueError("Malformed line at byte {} of {}: {}".format(
+            current[0], path, err)) from None
+
+
+def read_training_data(path):
+    """Yields the ``(text, label)`` tuples of a training data file in any of
+    the formats :meth:`~twentiment.classifier.Classifier.from_path` reads.
+    Line-delimited files are streamed, JSON documents are loaded whole and
+    their labels are interleaved, so every prefix holds all of them.
+    """
+
+    if os.path.splitext(path)[1].lower() in READERS:
+        yield from read_labeled_texts(path)
+        return
+
+    with open(path, 'r') as file:
+        data = json.load(file)['trainingData']
+
+    labels = sorted(data)
+    for texts in itertools.zip_longest(*(data[label] for label in labels)):
+        for text, label in zip(texts, labels):
+            if text is not None:
+                yield text, label
+
+
+def _featurize_range(args):
+    path, start, end = args
+    return [(extract_features(normalize_text(text)), label)
+            for (text, label) in read_labeled_texts(path, start, end)]
+
+
+def parallel_featuresets(path, processes=None, chunk_bytes=1 << 20):
+    """Normalizes and featurizes the tweets of ``path`` across a process pool
+    and yields ``(featureset, label)`` tuples.
+
+    The file is cut into byte ranges of about ``chunk_bytes``, and at most
+    two ranges per process are handed out ahead of the one being yielded, so
+    only a few chunks worth of featuresets are held in memory at a time,
+    however slowly they are consumed.
+
+    :param processes: Number of worker processes, defaults to the number of
+        CPUs.
+    """
+
+    parts = max(1, os.path.getsize(path) // chunk_bytes)
+    tasks = [(path, start, end) for (start, end) in byte_ranges(path, parts)]
+    # Pool.imap would featurize the whole file as fast as it can, no matter
+    # how far behind the consumer is.
+    window = 2 * (processes or os.cpu_count() or 1)
+
+    with multiprocessing.Pool(processes) as pool:
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= window:
+                yield from pending.popleft().get()
+            pending.append(pool.apply_async(_featurize_range, (task,)))
+
+        while pending:
+            yield from pending.popleft().get()
@@ -0,0 +1,185 @@
+"""
+Automatic labeling of raw tweets by their emoticons.
+
+Tweets with only positive emoticons (see
+:data:`~twentiment.text.POSITIVE_EMOTICONS`) are labeled positive, tweets
+with only negative ones negative. Tweets with both or neither are skipped.
+The input is a dump of tweets as JSON lines, e.g. as delivered by the
+streaming API, the output a training file in the JSON lines format of
+:mod:`twentiment.ingest`.
+
+The emoticons are removed from the labeled texts by default, so the classifier
+learns from the words that come with them rather than from the emoticons
+alone.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import re
+import json
+import multiprocessing
+from collections import Counter
+from twentiment.ingest import byte_ranges, read_range
+from twentiment.text import POSITIVE_EMOTICONS, NEGATIVE_EMOTICONS
+
+
+#: Matches any emoticon standing on its own between whitespace, so
+#: punctuation like ``(see below):`` isn't taken for one. Longer ones come
+#: first so ``:-)`` isn't taken for ``-)``.
+_EMOTICON_RE = re.compile(r'(?<!\S)(?:{})(?!\S)'.format('|'.join(
+    re.escape(emoticon) for emoticon in sorted(
+        POSITIVE_EMOTICONS | NEGATIVE_EMOTICONS, key=len, reverse=True))))
+
+#: The outcomes counted by :func:`label_lines`, in the order they are
+#: reported.
+OUTCOMES = ('positive', 'negative', 'ambiguous', 'unlabeled', 'malformed')
+
+
+def emoticon_label(text):
+    """Returns the label of ``text`` according to its emoticons: 'positive',
+    'negative', or ``None`` if it has both or neither.
+
+    >>> emoticon_label("so happy :-)")
+    'positive'
+    >>> emoticon_label("missed the bus ):")
+    'negative'
+    >>> emoticon_label("meh :) :(") is None
+    True
+
+    Only emoticons between whitespace count, not punctuation within words:
+
+    >>> emoticon_label("call me (see below): ok") is None
+    True
+    >>> emoticon_label("foo(:bar)") is None
+    True
+    """
+
+    positive = negative = False
+    for emoticon in _EMOTICON_RE.findall(text):
+        if emoticon in POSITIVE_EMOTICONS:
+            positive = True
+        else:
+            negative = True
+
+    if positive == negative:
+        return None
+
+    return 'positive' if positive else 'negative'
+
+
+def tweet_text(line, fields=('full_text', 'text')):
+    """Returns the text of the tweet on a line of a JSON dump, or ``None``
+    for records without one, e.g. deletion notices. That is the untruncated
+    ``extended_tweet.full_text`` of the streaming API if there is one, and
+    otherwise the first of ``fields`` the record has.
+
+    :param line: The line as a string, or as UTF-8 encoded bytes.
+    :raises ValueError: If the line isn't valid JSON or UTF-8.
+    """
+
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        return None
+
+    extended = record.get('extended_tweet')
+    if isinstance(extended, dict) and isinstance(extended.get('full_text'),
+                                                 str):
+        return extended['full_text']
+
+    for field in fields:
+        text = record.get(field)
+        if isinstance(text, str):
+            return text
+
+    return None
+
+
+def label_lines(lines, keep_emoticons=False):
+    """Labels the tweets on ``lines`` of a JSON dump. Lines may be bytes, so
+    lines that aren't valid UTF-8 are counted as malformed rather than
+    stopping the whole run.
+
+    :param keep_emoticons: Keep the emoticons in the labeled texts.
+    :returns: A tuple of the list of output lines, ``{"text", "label"}``
+        objects, and a :class:`~collections.Counter` of the
+        :data:`OUTCOMES`.
+    """
+
+    output = []
+    outcomes = Counter()
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            text = tweet_text(line)
+        except ValueError:
+            outcomes['malformed'] += 1
+            continue
+
+        # Most tweets have no emoticon at all, which is the cheapest check.
+        if text is None or _EMOTICON_RE.search(text) is None:
+            outcomes['unlabeled'] += 1
+            continue
+
+        label = emoticon_label(text)
+        if label is None:
+            outcomes['ambiguous'] += 1
+            continue
+
+        if not keep_emoticons:
+            text = ' '.join(_EMOTICON_RE.sub(' ', text).split())
+
+        outcomes[label] += 1
+        output.append(json.dumps({'text': text, 'label': label}) + '\n')
+
+    return output, outcomes
+
+
+def _label_range(args):
+    path, start, end, keep_emoticons = args
+    return label_lines(read_range(path, start, end, encoding=None),
+                       keep_emoticons)
+
+
+def label_files(paths, out, processes=None, keep_emoticons=False,
+                chunk_bytes=1 << 20):
+    """Labels the tweet dumps at ``paths`` across a process pool and writes
+    the training data to ``out``, in the order of the input.
+
+    The files are cut into byte ranges of about ``chunk_bytes``, like by
+    :func:`~twentiment.ingest.parallel_featuresets`.
+
+    :param processes: Number of worker processes, defaults to the number of
+        CPUs.
+    :returns: A :class:`~collections.Counter` of the :data:`OUTCOMES`.
+    """
+
+    tasks = []
+    for path in paths:
+        parts = max(1, os.path.getsize(path) // chunk_bytes)
+        tasks.extend((path, start, end, keep_emoticons)
+                     for (start, end) in byte_ranges(path, parts))
+
+    outcomes = Counter()
+    with multiprocessing.Pool(processes) as pool:
+        for output, counted in pool.imap(_label_range, tasks):
+            out.writelines(output)
+            outcomes.update(counted)
+
+    return outcomes
+
+
+def format_outcomes(outcomes):
+    """Formats the outcomes of :func:`label_files` as ``outcome=count``
+    pairs.
+
+    >>> format_outcomes({'positive': 2})
+    'positive=2 negative=0 ambiguous=0 unlabeled=0 malformed=0'
+    """
+
+    return ' '.join('{}={}'.format(outcome, outcomes.get(outcome, 0))
+                    for outcome in OUTCOMES)
@@ -0,0 +1,171 @@
+"""
+Memory accounting for trained models.
+
+The size of a model is found by walking its objects and adding up
+:func:`sys.getsizeof` of everything reachable, where every object is counted
+once and attributed to one category.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import sys
+from collections import OrderedDict
+
+
+#: The categories of a memory report, in the order they are reported.
+CATEGORIES = ('vocabulary', 'keys', 'index', 'freqdists', 'probdists',
+              'arrays', 'caches', 'labels')
+
+#: Attributes of frequency distributions holding derived, cached data.
+_CACHE_ATTRIBUTES = frozenset(['_Nr_cache', '_max_cache', '_item_cache'])
+
+
+class _Walker:
+    """Adds up the sizes of objects into categories, counting every object
+    only once.
+    """
+
+    def __init__(self):
+        self.report = OrderedDict((category, 0) for category in CATEGORIES)
+        self._seen = set()
+
+    def add(self, obj, category):
+        """Counts the shallow size of ``obj``. Returns ``False`` if it was
+        counted before.
+        """
+
+        if obj is None or id(obj) in self._seen:
+            return False
+
+        self._seen.add(id(obj))
+        self.report[category] += sys.getsizeof(obj)
+        return True
+
+    def add_deep(self, obj, category):
+        """Counts ``obj`` and everything contained in it."""
+
+        if not self.add(obj, category):
+            return
+
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                self.add_deep(key, category)
+                self.add_deep(value, category)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            for item in obj:
+                self.add_deep(item, category)
+
+        if hasattr(obj, '__dict__'):
+            self.add_deep(vars(obj), category)
+
+    def add_freqdist(self, freqdist, category='freqdists'):
+        if not self.add(freqdist, category):
+            return
+
+        for sample, count in dict.items(freqdist):
+            self.add_deep(sample, category)
+            self.add(count, category)
+
+        attributes = vars(freqdist)
+        self.add(attributes, category)
+        for name, value in attributes.items():
+            self.add_deep(value, 'caches' if name in _CACHE_ATTRIBUTES
+                          else category)
+
+    def add_probdist(self, probdist, category='probdists',
+                     freqdist_category='freqdists'):
+        if not self.add(probdist, category):
+            return
+
+        attributes = vars(probdist)
+        self.add(attributes, category)
+        for name, value in attributes.items():
+            if name == '_freqdist':
+                self.add_freqdist(value, freqdist_category)
+            else:
+                self.add_deep(value, category)
+
+
+def naive_bayes_report(classifier):
+    """Returns an ordered dict mapping the :data:`CATEGORIES` and ``total`` to
+    the number of bytes used by the parts of a
+    :class:`~twentiment.naivebayes.NaiveBayesClassifier`:
+
+    * ``vocabulary``: The feature name strings.
+    * ``keys``: The ``(label, fname)`` tuples indexing the feature
+      distributions.
+    * ``index``: The dict mapping the keys to the feature distributions.
+    * ``freqdists``: The frequency distributions' dicts and counts.
+    * ``probdists``: The probability distribution objects.
+    * ``arrays``: Flat arrays of probabilities (only used by compact
+      models).
+    * ``caches``: Data cached by the frequency distributions.
+    * ``labels``: The label distribution and list of labels.
+    """
+
+    walker = _Walker()
+
+    walker.add_deep(classifier._labels, 'labels')
+    walker.add_probdist(classifier._label_probdist, 'labels', 'labels')
+    walker.add(classifier._feature_probdist, 'index')
+
+    for key, probdist in classifier._feature_probdist.items():
+        label, fname = key
+        walker.add(key, 'keys')
+        walker.add(label, 'keys')
+        walker.add(fname, 'vocabulary')
+        walker.add_probdist(probdist)
+
+    report = walker.report
+    report['total'] = sum(report.values())
+    return report
+
+
+def compact_naive_bayes_report(classifier):
+    """Like :func:`naive_bayes_report`, but for a
+    :class:`~twentiment.naivebayes.CompactNaiveBayesClassifier`.
+    """
+
+    walker = _Walker()
+
+    walker.add(classifier, 'index')
+    walker.add_deep(classifier._labels, 'labels')
+    walker.add(classifier._label_logprob, 'labels')
+    walker.add(classifier._index, 'index')
+
+    for fname, i in classifier._index.items():
+        walker.add(fname, 'vocabulary')
+        walker.add(i, 'index')
+
+    for values in (classifier._true_logprob, classifier._none_logprob,
+                   classifier._other_logprob):
+        walker.add(values, 'arrays')
+
+    report = walker.report
+    report['total'] = sum(report.values())
+    return report
+
+
+def model_report(classifier):
+    """Returns the memory report of a naive bayes classifier, either the
+    regular or the compact one.
+    """
+
+    from twentiment.naivebayes import CompactNaiveBayesClassifier
+
+    if isinstance(classifier, CompactNaiveBayesClassifier):
+        return compact_naive_bayes_report(classifier)
+
+    return naive_bayes_report(classifier)
+
+
+def format_report(report):
+    """Formats a memory report as ``category=bytes`` pairs.
+
+    >>> format_report({'total': 2048})
+    'total=2048'
+    """
+
+    return ' '.join('{}={}'.format(category, size)
+                    for (category, size) in report.items())
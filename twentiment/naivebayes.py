@@ -31,10 +31,278 @@ sum to one:
 :license: Apache 2.0
 """
 
+import json
+import heapq
 import logging
-from collections import defaultdict
-from twentiment.thirdparty.probability import (FreqDist, DictionaryProbDist,
-                                               ELEProbDist, sum_logs)
+import functools
+import itertools
+import multiprocessing
+from array import array
+from collections import defaultdict, deque
+from twentiment.profiling import tracked
+from twentiment.thirdparty.probability import (
+    FreqDist, DictionaryProbDist, ELEProbDist, LaplaceProbDist,
+    WittenBellProbDist, HeldoutProbDist, CrossValidationProbDist, sum_logs)
+
+
+def _with_unseen_bin(estimator):
+    """Wrap an estimator that needs more bins than observed values, so one
+    bin is reserved for values that were never seen. Further parameters are
+    passed on to the estimator.
+    """
+
+    def build(freqdist, bins=None, **params):
+        if bins is None:
+            bins = freqdist.B()
+        return estimator(freqdist, bins=bins + 1, **params)
+
+    return build
+
+
+#: Estimators usable with :meth:`NaiveBayesClassifier.train`, by name.
+#: The maximum likelihood and Good-Turing estimates are not included: with
+#: only the values ``True`` and ``None`` per feature they assign no
+#: probability to some values, which rules out every label for tweets mixing
+#: positive and negative words. The heldout estimates need a second training
+#: set.
+ESTIMATORS = {
+    'ele': ELEProbDist,
+    'laplace': LaplaceProbDist,
+    'witten-bell': _with_unseen_bin(WittenBellProbDist),
+}
+
+
+def _fold_probdist(kind, signature):
+    """Build the heldout or cross-validation distribution of one count
+    signature, see :meth:`NaiveBayesClassifier.estimate_cross_validation`.
+    """
+
+    fold_counts, bins = signature
+    freqdists = [FreqDist(dict(counts)) for counts in fold_counts]
+
+    if kind == 'heldout':
+        return HeldoutProbDist(freqdists[0], freqdists[1], bins)
+
+    return CrossValidationProbDist(freqdists, bins)
+
+
+def _count_order(entry):
+    # Orders the [label, fval, count] entries of a feature independently of
+    # the order they were counted in, so equal counts are written equally.
+    label, fval, _ = entry
+    return label, json.dumps(fval)
+
+
+class NaiveBayesCounts(object):
+    """
+    The sufficient statistics of a Naive Bayes model: how often each label
+    occurred, and how often each feature value occurred given the label.
+    Counting is the expensive part of training, estimating the probabilities
+    from the counts (see :meth:`NaiveBayesClassifier.estimate`) is cheap.
+
+    Unlike the distributions of a trained classifier, the counts are not
+    back-filled with the ``None`` value, so they only grow with the features
+    actually seen.
+    """
+
+    def __init__(self):
+        #: Maps labels to the number of featuresets with that label.
+        self.label_freqdist = FreqDist()
+        #: Maps ``(label, fname)`` to the distribution of the feature values.
+        self.feature_freqdist = defaultdict(FreqDist)
+
+    def add(self, featureset, label):
+        """Count one classified featureset."""
+
+        # Track every label occurence.
+        self.label_freqdist.inc(label)
+
+        for fname, fval in featureset.items():
+            # Increment the freq(fval|label, fname)
+            self.feature_freqdist[label, fname].inc(fval)
+
+    def update(self, labeled_featuresets, progress=None):
+        """Count an iterable of ``(featureset, label)`` tuples.
+
+        :param progress: A :class:`~twentiment.profiling.Progress` the
+            ``count`` phase is reported to.
+        """
+
+        for featureset, label in tracked(labeled_featuresets, progress,
+                                         'count', self.vocabulary_size):
+            self.add(featureset, label)
+
+    def vocabulary_size(self):
+        """Return the number of distinct feature names counted."""
+
+        return len(set(fname for (_, fname) in self.feature_freqdist))
+
+    @classmethod
+    def folds(cls, labeled_featuresets, count):
+        """
+        Count ``(featureset, label)`` tuples into ``count`` separate
+        instances, e.g. for
+        :meth:`NaiveBayesClassifier.estimate_cross_validation`. The
+        featuresets of each label are dealt out to the folds in turn, so
+        every fold gets an equal share of every label.
+        """
+
+        folds = [cls() for _ in range(count)]
+        dealt = defaultdict(int)
+
+        for featureset, label in labeled_featuresets:
+            folds[dealt[label] % count].add(featureset, label)
+            dealt[label] += 1
+
+        return folds
+
+    def dump(self, file):
+        """
+        Write the counts to ``file`` as JSON lines. The first line holds the
+        label counts, every following line the counts of one feature name::
+
+            {"labels": {"negative": 2, "positive": 3}}
+            {"fname": "love", "counts": [["positive", true, 2]]}
+
+        The feature lines are sorted by feature name, so files can be merged
+        without loading them, see :meth:`merge`. Labels must be strings and
+        feature values JSON serializable.
+        """
+
+        by_fname = defaultdict(list)
+        for (label, fname), freqdist in self.feature_freqdist.items():
+            for fval, count in dict.items(freqdist):
+                by_fname[fname].append([label, fval, count])
+
+        NaiveBayesCounts._write_header(file, dict(self.label_freqdist))
+        for fname in sorted(by_fname):
+            NaiveBayesCounts._write_feature(file, fname, by_fname[fname])
+
+    @staticmethod
+    def _write_header(file, label_counts):
+        file.write(json.dumps({'labels': label_counts}, sort_keys=True) +
+                   "\n")
+
+    @staticmethod
+    def _write_feature(file, fname, entries):
+        file.write(json.dumps({'fname': fname,
+                               'counts': sorted(entries, key=_count_order)})
+                   + "\n")
+
+    @staticmethod
+    def merge(files, out):
+        """
+        Add up the counts :meth:`dump` wrote to each of ``files`` and write
+        the sums to ``out`` in the same format. The feature lines are merged
+        like sorted lists, so only one line per file is held in memory.
+
+        The counts are added exactly, so the result is the same as counting
+        all training sets at once, and merging is associative.
+        """
+
+        label_counts = {}
+        streams = []
+        for file in files:
+            lines = iter(file)
+            for label, count in json.loads(next(lines))['labels'].items():
+                label_counts[label] = label_counts.get(label, 0) + count
+            streams.append(json.loads(line) for line in lines)
+
+        NaiveBayesCounts._write_header(out, label_counts)
+
+        records = heapq.merge(*streams, key=lambda record: record['fname'])
+        for fname, group in itertools.groupby(
+                records, key=lambda record: record['fname']):
+            sums = {}
+            for record in group:
+                for entry in record['counts']:
+                    key = _count_order(entry)
+                    if key in sums:
+                        sums[key][2] += entry[2]
+                    else:
+                        sums[key] = entry
+
+            NaiveBayesCounts._write_feature(out, fname, sums.values())
+
+    @classmethod
+    def load(cls, file):
+        """Read counts written by :meth:`dump` from ``file``."""
+
+        counts = cls()
+        lines = iter(file)
+        counts.label_freqdist.update(json.loads(next(lines))['labels'])
+
+        for line in lines:
+            record = json.loads(line)
+            for label, fval, count in record['counts']:
+                counts.feature_freqdist[label, record['fname']].inc(fval,
+                                                                   count)
+
+        return counts
+
+
+def _subtract_counts(total, freqdist):
+    """Subtract the counts of ``freqdist`` from ``total``, removing samples
+    whose count drops to zero.
+    """
+
+    for sample, count in dict.items(freqdist):
+        remaining = dict.get(total, sample, 0) - count
+        # Setting the count keeps the total N right, FreqDist.pop doesn't.
+        total[sample] = remaining
+        if remaining <= 0:
+            dict.__delitem__(total, sample)
+
+
+class WindowedCounts(NaiveBayesCounts):
+    """
+    Counts over a sliding window of the most recent epochs, for training on
+    a continuous stream without the oldest data dominating forever.
+
+    Besides the totals, which are what :meth:`NaiveBayesClassifier.estimate`
+    sees, the counts of every epoch are kept in a ring of ``window``
+    buckets. :meth:`advance` starts a new epoch, and once the ring is full,
+    subtracts the oldest bucket from the totals in one go. Features whose
+    counts drop to zero are removed, so the memory used is bounded by what
+    ``window`` epochs contain, about twice over.
+    """
+
+    def __init__(self, window):
+        """
+        :param window: Number of epochs counted, including the current one.
+        """
+
+        if window < 1:
+            raise ValueError("The window must hold at least one epoch")
+
+        super(WindowedCounts, self).__init__()
+        self.window = window
+        #: The counts of each epoch, the current one last.
+        self.epochs = deque([NaiveBayesCounts()])
+
+    def add(self, featureset, label):
+        super(WindowedCounts, self).add(featureset, label)
+        self.epochs[-1].add(featureset, label)
+
+    def advance(self):
+        """
+        Start a new epoch. If that makes more than :attr:`window` epochs,
+        the oldest one is subtracted from the totals and returned.
+        """
+
+        self.epochs.append(NaiveBayesCounts())
+        if len(self.epochs) <= self.window:
+            return None
+
+        expired = self.epochs.popleft()
+        _subtract_counts(self.label_freqdist, expired.label_freqdist)
+        for key, freqdist in expired.feature_freqdist.items():
+            total = self.feature_freqdist[key]
+            _subtract_counts(total, freqdist)
+            if not total:
+                del self.feature_freqdist[key]
+
+        return expired
 
 
 class NaiveBayesClassifier(object):
@@ -66,68 +334,218 @@ class NaiveBayesClassifier(object):
         self._labels = list(label_probdist.samples())
 
     @staticmethod
-    def train(labeled_featuresets, estimator=ELEProbDist):
+    def train(labeled_featuresets, estimator=ELEProbDist, precompute=False,
+              progress=None):
         """
         :param labeled_featureset: A set of classified featuresets,
             i.e., a list of tuples ``[(featureset, label)]``.
         :param estimator: An estimator probability distribution. Defaults to an
-            expected likelyhood estimation probability distribution.
+            expected likelyhood estimation probability distribution. See
+            :data:`ESTIMATORS` for the ones that work with this classifier.
+        :param precompute: Freeze the estimated distributions into count to
+            probability tables (see
+            :meth:`~twentiment.thirdparty.probability.ProbDistI.freeze`),
+            which makes classifying with expensive estimators as cheap as
+            with the default one.
+        :param progress: A :class:`~twentiment.profiling.Progress` the
+            ``count``, ``backfill`` and ``estimate`` phases are reported to.
         """
 
-        label_freqdist = FreqDist()
-        #: Features and values are stored in dictionaries defaulting to
-        #: empty frequency distributions or sets, respectively.
-        feature_freqdist = defaultdict(FreqDist)
-        feature_values = defaultdict(set)
-        #: Set of all feature names used, across labels.
-        fnames = set()
+        counts = NaiveBayesCounts()
+        counts.update(labeled_featuresets, progress)
+        return NaiveBayesClassifier.estimate(counts, estimator, precompute,
+                                             progress, consume=True)
 
-        # Count how many times a particular feature value occured given the
-        # label and feature name.
-        for featureset, label in labeled_featuresets:
-            # Track every label occurence.
-            label_freqdist.inc(label)
-
-            for fname, fval in featureset.items():
-                # Increment the freq(fval|label, fname)
-                feature_freqdist[label, fname].inc(fval)
-                # Record that the fname can take the value fval.
-                feature_values[fname].add(fval)
-                # Keep a set of all used feature names.
-                fnames.add(fname)
-
-        for label in label_freqdist:
-            num_samples = label_freqdist[label]
-            for fname in fnames:
+    @staticmethod
+    def estimate(counts, estimator=ELEProbDist, precompute=False,
+                 progress=None, consume=False, **params):
+        """
+        Build a classifier from previously collected counts, so different
+        estimators and parameters can be tried without recounting the
+        training set. The counts are not modified, unless ``consume`` is
+        set.
+
+        :param counts: A :class:`NaiveBayesCounts` instance.
+        :param estimator: An estimator probability distribution, see
+            :meth:`train`.
+        :param precompute: See :meth:`train`.
+        :param progress: See :meth:`train`.
+        :param consume: Move the feature counts into the classifier instead
+            of copying them, which leaves ``counts`` without feature counts
+            but saves holding both at once.
+
+        Further keyword arguments are passed on to the estimator, e.g.
+        ``gamma`` for a
+        :class:`~twentiment.thirdparty.probability.LidstoneProbDist`.
+        """
+
+        label_freqdist = counts.label_freqdist
+        #: Set of the values each feature name was seen with, across labels.
+        feature_values = defaultdict(set)
+        for (_, fname), freqdist in counts.feature_freqdist.items():
+            feature_values[fname].update(dict.keys(freqdist))
+
+        feature_freqdist = {}
+        for fname in tracked(feature_values, progress, 'backfill',
+                             len(feature_values)):
+            for label in dict.keys(label_freqdist):
+                num_samples = label_freqdist[label]
                 # The count of the feature given the label.
-                count = feature_freqdist[label, fname].N()
+                if consume:
+                    freqdist = counts.feature_freqdist.pop((label, fname),
+                                                           None)
+                else:
+                    freqdist = counts.feature_freqdist.get((label, fname))
+                    if freqdist is not None:
+                        freqdist = freqdist.copy()
+                if freqdist is None:
+                    freqdist = FreqDist()
+                count = freqdist.N()
                 # Create a balance between the labels, such that for each
                 # 'missing' occasion of this feature in the current label,
                 # there is a 'None' element incremented. So in the end all
                 # freqdists have the same count, but with different fvalues.
-                feature_freqdist[label, fname].inc(None, num_samples - count)
+                freqdist.inc(None, num_samples - count)
                 # Make sure the values are aware of the None value.
                 if (num_samples - count > 0):
                     feature_values[fname].add(None)
+                feature_freqdist[label, fname] = freqdist
 
         #: The distribution P(label)
-        label_probdist = estimator(label_freqdist)
+        label_probdist = estimator(label_freqdist.copy(), **params)
+        if precompute:
+            label_probdist = label_probdist.freeze()
 
         #: The distribution P(fval|label, fname)
         feature_probdist = {}
-        for ((label, fname), freqdist) in feature_freqdist.items():
+        for ((label, fname), freqdist) in tracked(
+                feature_freqdist.items(), progress, 'estimate',
+                len(feature_values)):
             # Create the estimator with as many bins as there are values of the
             # current feature name.
-            probdist = estimator(freqdist, bins=len(feature_values[fname]))
+            probdist = estimator(freqdist, bins=len(feature_values[fname]),
+                                 **params)
+            if precompute:
+                probdist = probdist.freeze()
             feature_probdist[label, fname] = probdist
 
         return NaiveBayesClassifier(label_probdist, feature_probdist)
 
-    def prob_classify(self, featureset):
-        """Calculate the probabilities the given featureset classifications
-        and return a DictionaryProbDist instance.
+    @staticmethod
+    def estimate_heldout(base, heldout, processes=None):
+        """
+        Build a classifier whose feature distributions are heldout estimates,
+        based on the counts of two disjoint parts of a training set (see
+        :meth:`NaiveBayesCounts.folds`).
+
+        :param base: The :class:`NaiveBayesCounts` of the base part.
+        :param heldout: The :class:`NaiveBayesCounts` of the heldout part.
+        :param processes: Build the distributions across this many
+            processes. By default they are built in the calling process.
+        """
 
-        Works in O(nm) with n = # of labels, m = # of featureset elements.
+        return NaiveBayesClassifier._estimate_folds([base, heldout],
+                                                    'heldout', processes)
+
+    @staticmethod
+    def estimate_cross_validation(folds, processes=None):
+        """
+        Build a classifier whose feature distributions are cross-validation
+        estimates, i.e. the averages of the heldout estimates of each pair of
+        folds.
+
+        The estimate of a feature only depends on its counts in each fold,
+        and most features share their counts with many others, e.g. all
+        those seen once with a label. So only one distribution is built
+        for each distinct combination of counts, and shared by all features
+        having it.
+
+        :param folds: A list of :class:`NaiveBayesCounts` of disjoint parts of
+            the training set, see :meth:`NaiveBayesCounts.folds`.
+        :param processes: See :meth:`estimate_heldout`.
+        """
+
+        return NaiveBayesClassifier._estimate_folds(folds, 'cross-validation',
+                                                    processes)
+
+    @staticmethod
+    def _estimate_folds(folds, kind, processes=None):
+        label_freqdist = FreqDist()
+        for counts in folds:
+            label_freqdist.update(counts.label_freqdist)
+
+        labels = set(dict.keys(label_freqdist))
+        for counts in folds:
+            if set(dict.keys(counts.label_freqdist)) != labels:
+                raise ValueError("Every fold must contain every label")
+
+        feature_values = defaultdict(set)
+        for counts in folds:
+            for (_, fname), freqdist in counts.feature_freqdist.items():
+                feature_values[fname].update(dict.keys(freqdist))
+
+        # Collect the back-filled counts of each feature in every fold as a
+        # hashable signature. Equal signatures are only stored once.
+        interned = {}
+        fold_signatures = {}
+        for label in labels:
+            for fname in feature_values:
+                signature = []
+                for counts in folds:
+                    freqdist = counts.feature_freqdist.get((label, fname))
+                    items = dict(dict.items(freqdist)) if freqdist else {}
+                    missing = (counts.label_freqdist[label] -
+                               sum(items.values()))
+                    if missing > 0:
+                        items[None] = items.get(None, 0) + missing
+                        feature_values[fname].add(None)
+                    signature.append(frozenset(items.items()))
+
+                signature = tuple(signature)
+                fold_signatures[label, fname] = interned.setdefault(signature,
+                                                                    signature)
+
+        signatures = list(set((signature, len(feature_values[fname]))
+                              for ((_, fname), signature)
+                              in fold_signatures.items()))
+
+        build = functools.partial(_fold_probdist, kind)
+        if processes is not None and processes > 1:
+            with multiprocessing.Pool(processes) as pool:
+                probdists = pool.map(build, signatures,
+                                     chunksize=max(1, len(signatures) //
+                                                   (4 * processes)))
+        else:
+            probdists = [build(signature) for signature in signatures]
+
+        signatures = dict(zip(signatures, probdists))
+        feature_probdist = {}
+        for (label, fname), signature in fold_signatures.items():
+            feature_probdist[label, fname] = signatures[
+                signature, len(feature_values[fname])]
+
+        # Estimating the priors from folds would give labels with the same
+        # count in the base part the same probability, so they are smoothed
+        # with the default estimator instead.
+        return NaiveBayesClassifier(ELEProbDist(label_freqdist),
+                                    feature_probdist)
+
+    def label_logprobs(self):
+        """Return a dict mapping each label to its prior log probability
+        P(label).
+        """
+
+        return {label: self._label_probdist.logprob(label)
+                for label in self._labels}
+
+    def feature_logprobs(self, featureset):
+        """Return a dict mapping each label to the sum of the log
+        probabilities P(fname=fval|label) of the features in the given
+        featureset. Features that haven't been seen with any label are
+        ignored.
+
+        As the sum decomposes over the features, sums over disjoint parts of
+        a featureset can simply be added up.
         """
 
         # Work on a copy of the feature set, because we mutate it.
@@ -147,12 +565,7 @@ class NaiveBayesClassifier(object):
         # Instead of working with the product of the separate probabilities,
         # we use the sum of the logarithms to prevent underflows and make the
         # result more stable.
-
-        #: The probability of each label, given the features. Starting with
-        #: the probability of the label itself.
-        logprob = {}
-        for label in self._labels:
-            logprob[label] = self._label_probdist.logprob(label)
+        logprob = {label: 0.0 for label in self._labels}
 
         # Add the logarithmic probability of the features given the labels.
         for label in self._labels:
@@ -166,6 +579,154 @@ class NaiveBayesClassifier(object):
                     # the train() method.
                     logprob[label] += sum_logs([])  # = -INF.
 
+        return logprob
+
+    def prob_classify(self, featureset):
+        """Calculate the probabilities the given featureset classifications
+        and return a DictionaryProbDist instance.
+
+        Works in O(nm) with n = # of labels, m = # of featureset elements.
+        """
+
+        #: The probability of each label, given the features. Starting with
+        #: the probability of the label itself.
+        logprob = self.label_logprobs()
+        for label, value in self.feature_logprobs(featureset).items():
+            logprob[label] += value
+
+        return DictionaryProbDist(logprob, normalize=True, log=True)
+
+    def classify(self, featureset):
+        """Return the most likely label for a given featureset."""
+
+        return self.prob_classify(featureset).max()
+
+    def compact(self):
+        """Return a :class:`CompactNaiveBayesClassifier` with the same
+        probabilities as this classifier, but a much smaller memory footprint.
+        """
+
+        return CompactNaiveBayesClassifier.from_classifier(self)
+
+
+class CompactNaiveBayesClassifier(object):
+    """
+    A read-only Naive Bayes classifier that stores the log probabilities of
+    a trained :class:`NaiveBayesClassifier` in flat arrays instead of one
+    probability distribution object per (label, feature) pair.
+
+    Only boolean bag-of-words featuresets are supported, i.e. features that
+    were trained with the value ``True`` and back-filled with ``None``. For
+    each feature and label three log probabilities are stored: that of the
+    value ``True``, that of ``None`` and that of any other, unseen value.
+
+    The arrays are feature-major: the entry for feature ``i`` and label ``j``
+    is at position ``i * len(labels) + j``.
+    """
+
+    __slots__ = ('_labels', '_label_logprob', '_index', '_true_logprob',
+                 '_none_logprob', '_other_logprob')
+
+    def __init__(self, labels, label_logprob, index, true_logprob,
+                 none_logprob, other_logprob):
+        self._labels = labels
+        self._label_logprob = label_logprob
+        self._index = index
+        self._true_logprob = true_logprob
+        self._none_logprob = none_logprob
+        self._other_logprob = other_logprob
+
+    @classmethod
+    def from_classifier(cls, classifier):
+        """
+        Build a compact classifier from a trained
+        :class:`NaiveBayesClassifier`.
+
+        :raises ValueError: If a feature was trained with a value other than
+            ``True`` or ``None``.
+        """
+
+        labels = list(classifier._labels)
+        label_logprob = array('d', [classifier._label_probdist.logprob(label)
+                                    for label in labels])
+
+        # A sample that can't have been seen, to get the probability of
+        # unseen values.
+        unseen = object()
+        index = {}
+        logprobs = (array('d'), array('d'), array('d'))
+
+        fnames = sorted(set(fname for (_, fname)
+                            in classifier._feature_probdist))
+        for i, fname in enumerate(fnames):
+            index[fname] = i
+            for label in labels:
+                probdist = classifier._feature_probdist.get((label, fname))
+
+                if probdist is None:
+                    for values in logprobs:
+                        values.append(sum_logs([]))  # = -INF.
+                    continue
+
+                if any(fval is not True and fval is not None
+                       for fval in dict.keys(probdist.freqdist())):
+                    raise ValueError("Feature {!r} has non-boolean values, "
+                                     "which can't be compacted".format(fname))
+
+                for values, fval in zip(logprobs, (True, None, unseen)):
+                    values.append(probdist.logprob(fval))
+
+        return cls(labels, label_logprob, index, *logprobs)
+
+    def label_logprobs(self):
+        """Return a dict mapping each label to its prior log probability
+        P(label).
+        """
+
+        return dict(zip(self._labels, self._label_logprob))
+
+    def feature_logprobs(self, featureset):
+        """Return a dict mapping each label to the sum of the log
+        probabilities of the known features in the given featureset, see
+        :meth:`NaiveBayesClassifier.feature_logprobs`.
+        """
+
+        return dict(zip(self._labels, self._feature_sums(featureset)))
+
+    def _feature_sums(self, featureset):
+        num_labels = len(self._labels)
+        sums = [0.0] * num_labels
+
+        for fname, fval in featureset.items():
+            i = self._index.get(fname)
+            if i is None:
+                # Discard feature names we haven't been trained on.
+                continue
+
+            if fval is True:
+                values = self._true_logprob
+            elif fval is None:
+                values = self._none_logprob
+            else:
+                values = self._other_logprob
+
+            offset = i * num_labels
+            for j in range(num_labels):
+                sums[j] += values[offset + j]
+
+        return sums
+
+    def prob_classify(self, featureset):
+        """Calculate the probabilities the given featureset classifications
+        and return a DictionaryProbDist instance.
+        """
+
+        logprob = {}
+        sums = self._feature_sums(featureset)
+        for label, prior, value in zip(self._labels, self._label_logprob,
+                                       sums):
+            logprob[label] = prior + value
+
         return DictionaryProbDist(logprob, normalize=True, log=True)
 
     def classify(self, featureset):
@@ -0,0 +1,275 @@
+"""
+Pre-forked serving: the model is loaded once, and several worker processes
+forked afterwards share its memory pages copy-on-write.
+
+Sharing only lasts as long as nobody writes to the pages. CPython writes to
+every object it touches, to update the reference count, and the cyclic
+garbage collector writes to every container it traverses. So before forking,
+the model is compacted into flat arrays of floats, whose buffers are never
+touched by reference counting, and all objects alive at that point are moved
+out of the garbage collector's reach with :func:`gc.freeze`.
+
+The parent process runs a :class:`~twentiment.broker.Broker`, the children
+serve as its :class:`~twentiment.broker.Worker` instances over an IPC socket.
+Workers that die are replaced by new ones forked from the parent.
+
+A model loaded by a worker would be its own, unshared copy, so workers don't
+reload. ``SIGHUP`` makes the parent reload the model from the server's
+:attr:`~twentiment.server.Server.source` instead, freeze it, and replace the
+workers with ones forked afterwards. The old workers finish their current
+request before they leave.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import gc
+import sys
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import traceback
+from twentiment.broker import Broker, Worker
+
+
+def freeze(classifier):
+    """Prepares ``classifier`` for being shared by forked processes. Returns
+    a compact copy of the model if it can be compacted, otherwise the
+    classifier itself.
+    """
+
+    from twentiment.naivebayes import CompactNaiveBayesClassifier
+
+    if not isinstance(classifier.classifier, CompactNaiveBayesClassifier):
+        try:
+            classifier = classifier.compact()
+        except ValueError as err:
+            print("Serving the regular model: {}".format(err))
+
+    # Free the garbage of training first, so it doesn't end up frozen.
+    gc.collect()
+    gc.freeze()
+    return classifier
+
+
+def fork(target):
+    """Forks a child process that runs ``target`` and exits, with status 0
+    if it returns and 1 if it raises. Returns the child's pid.
+    """
+
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    status = 1
+    try:
+        target()
+        status = 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        # Never return into the parent's code.
+        os._exit(status)
+
+
+def reap(pids):
+    """Collects the workers in ``pids`` that have exited, without blocking,
+    and removes them from the list. Returns a list of ``(pid, status)``
+    tuples.
+    """
+
+    exited = []
+    for pid in list(pids):
+        try:
+            done, status = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            done, status = pid, None
+        if done:
+            pids.remove(pid)
+            exited.append((pid, status))
+
+    return exited
+
+
+def unique_set_size(pid):
+    """Returns the unique set size of process ``pid`` in bytes, the memory
+    that would be freed if the process exited, or ``None`` if it can't be
+    determined (only Linux is supported).
+    """
+
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid), 'r') as smaps:
+            lines = smaps.readlines()
+    except OSError:
+        return None
+
+    size = 0
+    for line in lines:
+        if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+            size += int(line.split()[1]) * 1024
+
+    return size
+
+
+class Prefork:
+    """Serves a :class:`~twentiment.server.Server` from several forked
+    worker processes.
+    """
+
+    #: Seconds between two checks for exited workers and finished reloads.
+    CHECK_INTERVAL = 0.5
+
+    def __init__(self, server, workers=2, report_interval=60.0):
+        """
+        :param server: The server, whose :attr:`bind` the clients connect to.
+            Its classifier is frozen with :func:`freeze`.
+        :param workers: Number of worker processes.
+        :param report_interval: Seconds between two reports of the workers'
+            unique set sizes. ``None`` disables reporting.
+        """
+
+        self.server = server
+        self.workers = workers
+        self.report_interval = report_interval
+        #: The pids of the current workers.
+        self.pids = []
+        #: The pids of workers serving an old model, which are leaving.
+        self.retiring = []
+        self._directory = tempfile.mkdtemp(prefix='twentiment-')
+        self._backend = "ipc://{}".format(os.path.join(self._directory,
+                                                       'backend'))
+        self._reload_requested = False
+        self._next_check = 0.0
+        #: The frozen classifier the current workers were forked with.
+        self._serving = None
+
+    def run(self):
+        """Forks the workers and runs the broker until the process receives
+        ``SIGTERM`` or ``SIGINT``.
+        """
+
+        self.server.classifier = self._serving = freeze(
+            self.server.classifier)
+
+        # The ZeroMQ contexts are created after forking, as they can't be
+        # shared across processes.
+        for _ in range(self.workers):
+            self.pids.append(fork(self._run_worker))
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        signal.signal(signal.SIGUSR1, self._forward_signal)
+        signal.signal(signal.SIGHUP, self._handle_reload_signal)
+
+        if self.report_interval is not None:
+            reporter = threading.Thread(target=self._report,
+                                        name='twentiment-report')
+            reporter.daemon = True
+            reporter.start()
+
+        try:
+            Broker(self.server.bind, self._backend).run(self._supervise)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop_workers()
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+    def _run_worker(self):
+        # Reloading is up to the parent, see _handle_reload_signal.
+        self.server._commands.pop('reload', None)
+        self.server.source = None
+        Worker(self.server, self._backend).run()
+
+    def _handle_reload_signal(self, signum, frame):
+        # Only take note, the broker's loop does the work.
+        self._reload_requested = True
+
+    def _supervise(self):
+        """Replaces exited workers, and all workers once a reloaded model is
+        ready. Called from the broker's loop.
+        """
+
+        if time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.CHECK_INTERVAL
+
+        reap(self.retiring)
+        for pid, status in reap(self.pids):
+            print("Worker {} exited with status {}, replacing it".format(
+                pid, status))
+            self.pids.append(fork(self._run_worker))
+
+        if self._reload_requested:
+            self._reload_requested = False
+            if self.server.source is None:
+                print("No source to reload from")
+                return
+            try:
+                self.server.reload(self.server.source)
+            except RuntimeError as err:
+                print("Not reloading: {}".format(err))
+
+        reloading = self.server._reload_thread
+        if reloading is not None and not reloading.is_alive():
+            self.server._reload_thread = None
+            self._replace_workers()
+
+    def _replace_workers(self):
+        if self.server.classifier is self._serving:
+            # The reload failed, the workers keep the current model.
+            return
+
+        self.server.classifier = self._serving = freeze(
+            self.server.classifier)
+        old, self.pids = self.pids, []
+        for _ in range(self.workers):
+            self.pids.append(fork(self._run_worker))
+
+        for pid in old:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self.retiring.extend(old)
+
+    def _forward_signal(self, signum, frame):
+        for pid in self.pids:
+            os.kill(pid, signum)
+
+    def _stop_workers(self):
+        pids = self.pids + self.retiring
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+    def _report(self):
+        # Give the workers a moment to start serving.
+        time.sleep(min(self.report_interval, 5.0))
+        while True:
+            print(self.format_report())
+            time.sleep(self.report_interval)
+
+    def format_report(self):
+        """Formats the unique set sizes of the workers, e.g.
+        ``Worker USS: 1234=2.1MiB 1235=2.0MiB``.
+        """
+
+        sizes = []
+        for pid in self.pids:
+            size = unique_set_size(pid)
+            sizes.append("{}={}".format(
+                pid, '?' if size is None else
+                "{:.1f}MiB".format(size / 2**20)))
+
+        return "Worker USS: {}".format(' '.join(sizes))
@@ -0,0 +1,202 @@
+"""
+Lightweight instrumentation helpers for timing start-up and training phases.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    """Records the wall clock duration of named phases in the order they
+    were run. Optionally, the peak memory allocated while each phase ran is
+    recorded as well.
+
+    >>> timer = PhaseTimer()
+    >>> with timer.phase('work'):
+    ...     pass
+    >>> [name for (name, duration) in timer.phases]
+    ['work']
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        :param trace_memory: Trace allocations with :mod:`tracemalloc` to
+            record each phase's peak memory in :attr:`peaks`. This slows down
+            the traced code considerably, until :meth:`close` is called.
+        """
+
+        self.phases = []
+        #: Maps phase names to the peak traced memory in bytes.
+        self.peaks = {}
+        self.trace_memory = trace_memory
+        self._started = time.perf_counter()
+        #: Peaks of the nested phases of each running phase.
+        self._child_peaks = []
+        #: Whether tracing was started by this timer, see :meth:`close`.
+        self._tracing = False
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def close(self):
+        """Stops tracing allocations, if the timer started it. Phases timed
+        afterwards don't record their peak memory.
+        """
+
+        self.trace_memory = False
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager that times the enclosed block as phase ``name``."""
+
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._child_peaks.append(0)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+            if self.trace_memory:
+                # Nested phases reset the peak, so take theirs into account.
+                peak = max(tracemalloc.get_traced_memory()[1],
+                           self._child_peaks.pop())
+                self.peaks[name] = peak
+                if self._child_peaks:
+                    self._child_peaks[-1] = max(self._child_peaks[-1], peak)
+
+    def total(self):
+        """Seconds elapsed since the timer was created."""
+
+        return time.perf_counter() - self._started
+
+    def report(self, file=None):
+        """Writes a table of all recorded phases to ``file``, which defaults
+        to ``sys.stderr``.
+        """
+
+        file = file or sys.stderr
+        width = max([len(name) for (name, _) in self.phases] + [len('total')])
+
+        for name, duration in self.phases:
+            line = "{0:<{1}}  {2:9.2f} ms".format(name, width, duration * 1e3)
+            if name in self.peaks:
+                line += "  {:9.1f} MiB peak".format(self.peaks[name] / 2**20)
+            print(line, file=file)
+        print("{0:<{1}}  {2:9.2f} ms".format('total', width,
+                                              self.total() * 1e3), file=file)
+
+
+@contextmanager
+def optional_phase(timer, name):
+    """Like :meth:`PhaseTimer.phase`, but does nothing if ``timer`` is
+    ``None``.
+    """
+
+    if timer is None:
+        yield
+    else:
+        with timer.phase(name):
+            yield
+
+
+class Progress:
+    """Prints the progress of long running training phases: the number of
+    items processed, the rate, the vocabulary size and the elapsed time. It
+    is called by the training code as
+    ``progress(phase, count, vocabulary=None, final=False)``:
+
+    :param phase: Name of the phase. A call with ``count`` 0 starts it.
+    :param count: Number of items processed so far.
+    :param vocabulary: Number of feature names seen so far, or a callable
+        returning it. Callables are only called when a line is printed, so
+        the size may be expensive to find.
+    :param final: Whether the phase is done.
+
+    Lines are printed at most every ``interval`` seconds, and once per phase
+    when it is done. :meth:`summary` writes a table of all finished phases.
+    """
+
+    #: Units of the items counted by each phase, ``docs`` by default.
+    UNITS = {'backfill': 'features', 'estimate': 'distributions'}
+
+    def __init__(self, file=None, interval=5.0):
+        self.file = file or sys.stderr
+        self.interval = interval
+        #: Tuples ``(phase, count, seconds, vocabulary)`` of finished phases.
+        self.phases = []
+        self._started = {}
+        self._printed = time.perf_counter()
+
+    def __call__(self, phase, count, vocabulary=None, final=False):
+        now = time.perf_counter()
+        if count == 0 and not final:
+            self._started[phase] = now
+            return
+
+        if not final and now - self._printed < self.interval:
+            return
+
+        self._printed = now
+        if callable(vocabulary):
+            vocabulary = vocabulary()
+
+        elapsed = now - self._started.get(phase, now)
+        unit = self.UNITS.get(phase, 'docs')
+        line = "{}: {}{} {} in {:.1f}s ({:.0f} {}/s)".format(
+            phase, 'done, ' if final else '', count, unit, elapsed,
+            count / elapsed if elapsed else 0, unit)
+        if vocabulary is not None:
+            line += ", vocabulary {}".format(vocabulary)
+        print(line, file=self.file)
+
+        if final:
+            self.phases.append((phase, count, elapsed, vocabulary))
+
+    def summary(self, file=None):
+        """Writes a table of the finished phases to ``file``, which defaults
+        to the file progress is printed to.
+        """
+
+        file = file or self.file
+        width = max([len(phase) for (phase, _, _, _) in self.phases] +
+                    [len('phase')])
+
+        print("{0:<{1}}  {2:>10}  {3:>9}  {4:>10}  {5:>10}".format(
+            'phase', width, 'items', 'seconds', 'items/s', 'vocabulary'),
+            file=file)
+        for phase, count, elapsed, vocabulary in self.phases:
+            print("{0:<{1}}  {2:>10}  {3:>9.2f}  {4:>10.0f}  {5:>10}".format(
+                phase, width, count, elapsed, count / elapsed if elapsed
+                else 0, '' if vocabulary is None else vocabulary), file=file)
+
+
+def tracked(iterable, progress, phase, vocabulary=None, every=1000):
+    """Yields the items of ``iterable``, reporting the progress of ``phase``
+    to ``progress`` (see :class:`Progress`) every ``every`` items. Does
+    nothing but yield if ``progress`` is ``None``.
+    """
+
+    if progress is None:
+        yield from iterable
+        return
+
+    progress(phase, 0)
+    count = 0
+    for item in iterable:
+        yield item
+        count += 1
+        if count % every == 0:
+            progress(phase, count, vocabulary)
+
+    progress(phase, count, vocabulary, final=True)
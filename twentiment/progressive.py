@@ -0,0 +1,203 @@
+"""
+Progressive start-up: serve from a partial model while training continues.
+
+Training on a large corpus takes a while, during which a server would be
+unavailable. :class:`ProgressiveTrainer` instead trains on the first tweets of
+each label, hands the resulting model to the server, and keeps counting the
+rest in a background thread. Every so often it estimates a new model from the
+counts so far and swaps it in. Rebinding the server's classifier is atomic, so
+requests see either the old or the new snapshot.
+
+Estimating a snapshot copies the counts, so while one is built, the counts,
+the current model and the new one are held in memory at the same time.
+
+For an endless stream, the counts can be limited to a window of the most
+recent snapshot intervals with
+:class:`~twentiment.naivebayes.WindowedCounts`, so the model follows the
+current sentiment and memory stays bounded.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import sys
+import time
+import itertools
+import threading
+import traceback
+from collections import Counter
+from twentiment.extract import extract_features
+from twentiment.text import normalize_text
+
+
+class ProgressiveTrainer:
+    """Trains the classifier of a :class:`~twentiment.server.Server` in the
+    background, publishing snapshots as it goes.
+    """
+
+    #: Number of tweets counted between two checks whether a snapshot is due.
+    CHECK_EVERY = 1000
+
+    def __init__(self, server, labeled_texts, initial=1000, interval=60.0,
+                 labels=('positive', 'negative'), window=None,
+                 max_deferred=100000, **kwargs):
+        """
+        :param server: The server to publish the snapshots to. Its
+            :attr:`~twentiment.server.Server.trainer` is set to this
+            instance.
+        :param labeled_texts: Iterable of ``(text, label)`` tuples, see
+            :func:`twentiment.ingest.read_training_data`.
+        :param initial: The first snapshot is published once this many tweets
+            of each of the ``labels`` have been counted.
+        :param interval: Minimum number of seconds between two snapshots.
+        :param labels: The labels the first snapshot needs.
+        :param window: Only keep the counts of this many snapshot intervals,
+            the current one included. ``None`` keeps all counts.
+        :param max_deferred: Training fails if more than this many tweets of
+            labels that already have :attr:`initial` tweets are read before
+            the others do, as they are held in memory until then. This
+            usually means the labels of the input don't match ``labels``.
+
+        Further keyword arguments, e.g. ``estimator`` and ``compact``, are
+        passed on to :meth:`~twentiment.classifier.Classifier.from_counts`.
+        """
+
+        self.server = server
+        self.labeled_texts = labeled_texts
+        self.initial = initial
+        self.interval = interval
+        self.labels = labels
+        self.window = window
+        self.max_deferred = max_deferred
+        self.options = kwargs
+        #: Number of tweets counted so far.
+        self.trained = 0
+        #: Number of tweets counted when the last snapshot was published.
+        self.published = 0
+        #: Number of tweets the published model was trained on, which is
+        #: less than :attr:`published` if old counts expired.
+        self.model_size = 0
+        #: Number of snapshots published.
+        self.snapshots = 0
+        #: The exception training failed with, if it did.
+        self.error = None
+        self._thread = None
+        server.trainer = self
+
+    @property
+    def running(self):
+        """Whether training is still in progress."""
+
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        """Returns a list of ``(field, value)`` tuples describing the progress
+        of training, for the server's ``STATUS`` command.
+        """
+
+        if self.running:
+            state = 'running'
+        elif self.error is not None:
+            state = 'failed'
+        else:
+            state = 'done'
+
+        fields = [
+            ('training', state),
+            ('trained', self.trained),
+            ('model', self.model_size),
+            ('snapshots', self.snapshots),
+            ('window', self.window or '-'),
+        ]
+        if self.error is not None:
+            fields.append(('error', type(self.error).__name__))
+
+        return fields
+
+    def start(self):
+        """Starts training in a background thread and returns the thread."""
+
+        self._thread = threading.Thread(target=self._run,
+                                        name='twentiment-train')
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def _run(self):
+        from twentiment.naivebayes import NaiveBayesCounts, WindowedCounts
+
+        if self.window is None:
+            counts = NaiveBayesCounts()
+        else:
+            counts = WindowedCounts(self.window)
+
+        try:
+            rest = self._count_initial(counts)
+            self._publish(counts)
+
+            due = time.monotonic() + self.interval
+            for text, label in rest:
+                counts.add(extract_features(normalize_text(text)), label)
+                self.trained += 1
+
+                if self.trained % self.CHECK_EVERY == 0 and \
+                        time.monotonic() >= due:
+                    self._publish(counts)
+                    due = time.monotonic() + self.interval
+
+            if self.trained > self.published:
+                self._publish(counts)
+        except Exception as err:
+            self.error = err
+            print("Progressive training failed: {}".format(err),
+                  file=sys.stderr)
+            traceback.print_exc()
+
+    def _count_initial(self, counts):
+        """Counts the first :attr:`initial` tweets of each label. Returns an
+        iterator over the remaining tweets, including those that were read
+        but not counted yet.
+        """
+
+        stream = iter(self.labeled_texts)
+        per_label = Counter()
+        deferred = []
+
+        for text, label in stream:
+            if per_label[label] < self.initial:
+                counts.add(extract_features(normalize_text(text)), label)
+                per_label[label] += 1
+                self.trained += 1
+            else:
+                deferred.append((text, label))
+                if len(deferred) > self.max_deferred:
+                    missing = [label for label in self.labels
+                               if per_label[label] < self.initial]
+                    raise ValueError(
+                        "Read {} tweets without getting {} of each of {}, "
+                        "check the labels of the input".format(
+                            self.trained + len(deferred), self.initial,
+                            ', '.join(missing)))
+
+            if all(per_label[label] >= self.initial
+                   for label in self.labels):
+                break
+
+        return itertools.chain(deferred, stream)
+
+    def _publish(self, counts):
+        from twentiment.classifier import Classifier
+
+        start = time.perf_counter()
+        trained = self.trained
+        classifier = Classifier.from_counts(counts, **self.options)
+
+        self.server.classifier = classifier
+        self.published = trained
+        self.model_size = counts.label_freqdist.N()
+        self.snapshots += 1
+        print("Published a model of {} tweets in {:.2f}s".format(
+            trained, time.perf_counter() - start))
+
+        if self.window is not None:
+            counts.advance()
@@ -0,0 +1,113 @@
+"""
+A low-overhead sampling profiler for a single running thread.
+
+Instead of tracing every call like :mod:`cProfile`, a background thread
+periodically looks at the current stack of the profiled thread and counts how
+often each distinct stack was seen. The result is written in the "collapsed
+stack" format understood by flame graph tools::
+
+    twentiment.server:run;twentiment.text:normalize_text 42
+
+When no sampling window is active there is no sampler thread at all, so the
+profiled code runs without any overhead.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+
+def _collapse(frame):
+    """Returns the stack of ``frame`` as a ``;``-separated string, outermost
+    frame first.
+    """
+
+    names = []
+    while frame is not None:
+        names.append("{}:{}".format(frame.f_globals.get('__name__', '?'),
+                                    frame.f_code.co_name))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stack of one thread for a limited time window."""
+
+    def __init__(self, thread_id=None, interval=0.005):
+        """
+        :param thread_id: Identifier of the thread to profile, defaults to the
+            thread creating the sampler.
+        :param interval: Seconds between two samples.
+        """
+
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        #: Path the current or last sampling window is written to.
+        self.path = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration, path):
+        """Starts sampling for ``duration`` seconds in the background. The
+        collapsed stacks are written to ``path`` once the window is over or
+        :meth:`stop` was called.
+
+        :raises RuntimeError: If a sampling window is already active.
+        """
+
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+
+        self._stop.clear()
+        self.path = path
+        self._thread = threading.Thread(target=self._run,
+                                        args=(duration, path),
+                                        name='twentiment-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+        return path
+
+    def stop(self):
+        """Ends the current sampling window early and waits for the result to
+        be written.
+        """
+
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, duration, path):
+        counts = Counter()
+        deadline = time.monotonic() + duration
+
+        while time.monotonic() < deadline and not self._stop.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                # The profiled thread is gone.
+                break
+
+            counts[_collapse(frame)] += 1
+            del frame
+            self._stop.wait(self.interval)
+
+        self._write(counts, path)
+
+    def _write(self, counts, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as out:
+            for stack, count in counts.most_common():
+                out.write("{} {}\n".format(stack, count))
+
+        os.replace(tmp_path, path)
@@ -0,0 +1,52 @@
+"""
+Streaming sampling of labeled training data.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import random
+
+
+def stratified_reservoir(labeled_items, size, seed=None):
+    """Draws a uniform random sample of at most ``size`` items per label from
+    an iterable of ``(item, label)`` tuples in a single pass.
+
+    Only the samples themselves are kept in memory, so the input can be an
+    arbitrarily large stream. Every item of a label has the same probability
+    of ending up in that label's sample (reservoir sampling, "Algorithm R").
+
+    :param labeled_items: Iterable of ``(item, label)`` tuples.
+    :param size: Maximum number of items to keep per label.
+    :param seed: Seed for the random number generator, to make the sample
+        reproducible.
+    :returns: A dict mapping each label to its list of sampled items.
+
+    >>> items = [(n, 'even' if n % 2 == 0 else 'odd') for n in range(100)]
+    >>> sample = stratified_reservoir(items, 3, seed=42)
+    >>> sorted(sample)
+    ['even', 'odd']
+    >>> [len(sample[label]) for label in sorted(sample)]
+    [3, 3]
+    >>> all(n % 2 == 0 for n in sample['even'])
+    True
+    """
+
+    rng = random.Random(seed)
+    reservoirs = {}
+    seen = {}
+
+    for item, label in labeled_items:
+        count = seen.get(label, 0) + 1
+        seen[label] = count
+
+        if count <= size:
+            reservoirs.setdefault(label, []).append(item)
+        else:
+            # Replace a random element, such that after n items each one was
+            # kept with probability size / n.
+            index = rng.randrange(count)
+            if index < size:
+                reservoirs[label][index] = item
+
+    return reservoirs
@@ -0,0 +1,181 @@
+"""
+Offline bulk scoring of tweets with a process pool.
+
+The classifier is frozen (see :func:`twentiment.prefork.freeze`) and stored in
+a module global before the worker processes are forked, so all workers share
+the parent's copy of the model instead of each receiving a pickled one.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import gc
+import sys
+import json
+import time
+import itertools
+import multiprocessing
+from collections import Counter, deque
+
+
+#: The classifier used by the worker processes, inherited through fork.
+_classifier = None
+
+
+def _score_batch(texts):
+    return [_classifier.score(text) for text in texts]
+
+
+def chunked(iterable, size):
+    """Yields lists of up to ``size`` consecutive items of ``iterable``.
+
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def read_records(lines, input_format='lines', skipped=None):
+    """Yields ``(record, text)`` tuples from the input lines. With the
+    ``jsonl`` format ``record`` is the parsed JSON object and ``text`` its
+    ``text`` field, with the ``lines`` format each line is a tweet and
+    ``record`` is ``None``. Blank lines are skipped.
+
+    :param skipped: A :class:`~collections.Counter`. JSON lines that can't be
+        parsed or have no ``text`` are skipped and counted as ``malformed``
+        in it.
+    """
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+
+        if input_format != 'jsonl':
+            yield None, line
+            continue
+
+        try:
+            record = json.loads(line)
+            text = record['text']
+        except (ValueError, KeyError, TypeError):
+            text = None
+        if not isinstance(text, str):
+            if skipped is not None:
+                skipped['malformed'] += 1
+            continue
+
+        yield record, text
+
+
+def format_result(record, score):
+    """Formats one output line. JSON records are written back with an added
+    ``score`` field, plain tweets are replaced by their score.
+    """
+
+    if record is None:
+        return "{}\n".format(score)
+
+    record['score'] = score
+    return json.dumps(record) + "\n"
+
+
+def score_stream(classifier, records, out, processes=None, batch_size=500):
+    """Scores ``(record, text)`` tuples and writes the results to ``out`` in
+    input order.
+
+    Only a fixed number of batches per worker process is in flight at any
+    time, so the memory used doesn't depend on the size of the input.
+
+    :param processes: Number of worker processes, defaults to the number of
+        CPUs. With 1, everything is scored in the calling process.
+    :returns: The number of scored tweets.
+    """
+
+    global _classifier
+    _classifier = classifier
+
+    batches = chunked(records, batch_size)
+    count = 0
+
+    if processes == 1:
+        for batch in batches:
+            scores = _score_batch([text for (_, text) in batch])
+            for (record, _), score in zip(batch, scores):
+                out.write(format_result(record, score))
+            count += len(batch)
+
+        return count
+
+    # Without freezing, the children would copy the model page by page as
+    # they touch the reference counts of its objects.
+    from twentiment.prefork import freeze
+    _classifier = freeze(classifier)
+
+    context = multiprocessing.get_context('fork')
+    try:
+        with context.Pool(processes) as pool:
+            window = 4 * (processes or multiprocessing.cpu_count())
+            pending = deque()
+
+            for batch in batches:
+                pending.append((batch, pool.apply_async(
+                    _score_batch, ([text for (_, text) in batch],))))
+
+                # Write the oldest batch once the window is full, which keeps
+                # the output in order and the number of buffered batches
+                # bounded.
+                while len(pending) >= window:
+                    count += _write_batch(out, *pending.popleft())
+
+            while pending:
+                count += _write_batch(out, *pending.popleft())
+    finally:
+        gc.unfreeze()
+
+    return count
+
+
+def _write_batch(out, batch, result):
+    for (record, _), score in zip(batch, result.get()):
+        out.write(format_result(record, score))
+
+    return len(batch)
+
+
+def run(classifier, files, input_format='lines', processes=None,
+        batch_size=500, out=None, report=None):
+    """Scores all tweets in ``files``, a list of paths where ``-`` means
+    standard input, and reports the throughput to ``report``.
+    """
+
+    out = out or sys.stdout
+    report = report or sys.stderr
+
+    skipped = Counter()
+
+    def _records():
+        for path in files:
+            if path == '-':
+                yield from read_records(sys.stdin, input_format, skipped)
+            else:
+                with open(path, 'r') as file:
+                    yield from read_records(file, input_format, skipped)
+
+    start = time.perf_counter()
+    count = score_stream(classifier, _records(), out, processes, batch_size)
+    elapsed = time.perf_counter() - start
+
+    print("Scored {} tweets in {:.2f}s ({:.0f} tweets/s), skipped {} "
+          "malformed lines".format(count, elapsed,
+                                   count / elapsed if elapsed else 0,
+                                   skipped['malformed']), file=report)
+
+    return count
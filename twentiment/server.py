@@ -5,9 +5,32 @@ A ZeroMQ-based server that answeres guessing queries.
 :license: Apache 2
 """
 
+import os
+import sys
+import math
+import time
+import signal
+import resource
+import tempfile
+import threading
+import traceback
+from collections import deque
 import zmq
-from twentiment.extract import extract_features
-from twentiment.text import normalize_text
+from twentiment.sampler import StackSampler
+
+
+def resident_set_size():
+    """Returns the current resident set size of the process in KiB, or
+    ``None`` if it can't be determined (only Linux is supported).
+    """
+
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
 
 
 class Server:
@@ -17,6 +40,28 @@ class Server:
 
         -> GUESS [tweet:str]
         <- OK [guess:float]
+
+        -> PROFILE [seconds:float]
+        <- OK [path:str]
+
+        -> PROFILE STOP
+        <- OK [path:str]
+
+        -> RELOAD [path:str]
+        <- OK RELOADING [path:str]
+
+        -> MEMORY
+        <- OK [category:str]=[bytes:int] ...
+
+        -> DEADLINE [unix_time:float] [request:str]
+        <- [response to request]
+
+        -> ID [request_id:str] [request:str]
+        <- [response to request]
+
+        -> STATUS
+        <- OK ready=[0|1] [field:str]=[value:str] ...
+
         - OR -
         <- ERROR [code:str] [description?:str]
 
@@ -26,55 +71,578 @@ class Server:
         * RUNTIME_ERROR: An error on the server side occured.
         * BAD_FORMAT: A request must start with a command separated by an
             ASCII space (20)
+        * BAD_REQUEST: A ``DEADLINE`` or ``ID`` prefix was given twice.
+        * TOO_LARGE: The request is longer than :attr:`MAX_MESSAGE`.
+        * NOT_PROFILING: ``PROFILE STOP`` was sent while not profiling.
+        * RELOAD_IN_PROGRESS: Another model is still being loaded.
+        * OVERLOADED: Too many requests are waiting to be processed.
+        * NOT_READY: No model has been loaded yet.
+
+    ``PROFILE`` samples the serving thread for the given number of seconds,
+    at most :attr:`MAX_PROFILE_SECONDS`, and writes the collapsed stacks to
+    the returned path. ``PROFILE STOP`` ends the window early. Sending
+    ``SIGUSR1`` to the server process profiles for :attr:`PROFILE_SECONDS`
+    seconds.
+
+    ``RELOAD`` trains a new classifier from the given file in a background
+    thread while the current one keeps answering queries, and swaps it in once
+    it is ready. ``SIGHUP`` reloads from :attr:`source`.
+
+    ``MEMORY`` breaks down the memory used by the loaded model, see
+    :meth:`~twentiment.classifier.Classifier.memory_report`.
+
+    ``DEADLINE`` can prefix any request. If the request is still queued when
+    the deadline has passed, the client has given up on it already and it is
+    dropped without a response.
+
+    ``ID`` can prefix any request, too. It tags the request with an ID that
+    doesn't contain spaces, under which it shows up in the slow-query log,
+    see :class:`~twentiment.slowlog.SlowLog`. A request may have at most one
+    prefix of each kind, in any order.
+
+    ``STATUS`` tells whether the server is ready to answer ``GUESS``
+    requests. While a :class:`~twentiment.progressive.ProgressiveTrainer` is
+    attached, it also reports the progress of training: whether it is
+    ``running`` or ``done``, the number of tweets ``trained`` so far, the
+    number the current ``model`` was trained on and the number of
+    ``snapshots`` published.
 
     (* Not really worth calling it that.)
     """
-    def __init__(self, classifier, bind="tcp://127.0.0.1:10001"):
+
+    #: Length of a profiling window triggered by ``SIGUSR1``.
+    PROFILE_SECONDS = 30
+
+    #: Longer ``PROFILE`` windows are cut to this many seconds.
+    MAX_PROFILE_SECONDS = 600
+
+    #: Commands that may be sent without an argument.
+    BARE_COMMANDS = frozenset(['memory', 'status'])
+
+    #: Requests longer than this many characters are rejected with
+    #: ``TOO_LARGE``, prefixes included.
+    MAX_MESSAGE = 64 * 1024
+
+    def __init__(self, classifier, bind="tcp://127.0.0.1:10001",
+                 profile_dir=None, loader=None, source=None, hwm=1000,
+                 max_queue=None, max_input=None, slow_log=None):
         """Creates a new server instance.
 
+        :param classifier: The classifier answering the queries. May be
+            ``None`` until a
+            :class:`~twentiment.progressive.ProgressiveTrainer` publishes the
+            first model.
         :param bind: The zmq bind, defaults to tcp://127.0.0.1:10001.
             Obviously, the same must be used on the client side.
+        :param profile_dir: Directory profiles are written to, defaults to the
+            system's temporary directory.
+        :param loader: Callable creating a new classifier from a file path,
+            used for reloading. Defaults to
+            :meth:`~twentiment.classifier.Classifier.from_path`.
+        :param source: Path the current classifier was loaded from. ``SIGHUP``
+            reloads from this path.
+        :param hwm: ZeroMQ high-water mark, the number of messages buffered
+            per client connection.
+        :param max_queue: Requests received while this many are waiting are
+            rejected with ``OVERLOADED`` right away. ``None`` means no limit.
+            Must be at least 1.
+        :param max_input: Only the first ``max_input`` characters of a tweet
+            are tokenized. ``None`` means no limit.
+        :param slow_log: A :class:`~twentiment.slowlog.SlowLog` that slow
+            ``GUESS`` requests are written to.
         """
 
+        if max_queue is not None and max_queue < 1:
+            raise ValueError("max_queue must be at least 1")
+
         self.bind = bind
         self.classifier = classifier
+        self.profile_dir = profile_dir or tempfile.gettempdir()
+        self.loader = loader
+        self.source = source
+        self.hwm = hwm
+        self.max_queue = max_queue
+        self.max_input = max_input
+        self.slow_log = slow_log
+        #: Statistics of the last completed reload: its ``path``, the
+        #: ``seconds`` it took, the current resident set sizes in KiB before
+        #: loading and once both models were loaded, and the high-water mark
+        #: ``max_rss``, see :meth:`reload`.
+        self.last_reload = None
+        #: The :class:`~twentiment.progressive.ProgressiveTrainer` training
+        #: the classifier, if any.
+        self.trainer = None
+        self._sampler = None
+        #: ID of the request being handled, see :meth:`_id_command`.
+        self._request_id = None
+        self._reload_thread = None
+        self._reload_lock = threading.Lock()
+        self._commands = {
+            'guess': self._guess_command,
+            'profile': self._profile_command,
+            'reload': self._reload_command,
+            'memory': self._memory_command,
+            'status': self._status_command,
+        }
+        #: Commands prefixing another request. Their handlers return a
+        #: tuple of the request to go on with, or ``None`` and the response.
+        self._prefixes = {
+            'deadline': self._deadline_prefix,
+            'id': self._id_prefix,
+        }
 
     def run(self):
         """Starts a blocking server."""
 
         context = zmq.Context()
-        socket = context.socket(zmq.REP)
+        # A ROUTER socket instead of REP lets us look at everything that is
+        # waiting, so we can reject or drop requests instead of letting the
+        # backlog grow without bounds.
+        socket = context.socket(zmq.ROUTER)
+        socket.setsockopt(zmq.RCVHWM, self.hwm)
+        socket.setsockopt(zmq.SNDHWM, self.hwm)
 
         socket.bind(self.bind)
+        self.prepare()
 
         print("Starting server on {}".format(self.bind))
+        queue = deque()
         while True:
-            message = socket.recv()
+            if not queue:
+                socket.poll()
+            self._drain(socket, queue)
+            if not queue:
+                continue
+
+            # All frames but the last are the client's routing envelope,
+            # which has to be sent back with the response.
+            frames = queue.popleft()
+            envelope, message = frames[:-1], frames[-1]
             try:
                 response = self._handle_message(str(message, "utf-8"))
             except Exception as err:
                 response = self._error_response("RUNTIME_ERROR " + str(err))
-                socket.send_unicode(response)
+                socket.send_multipart(envelope + [response.encode('utf-8')])
 
                 raise
 
-            socket.send_unicode(response)
+            if response is not None:
+                socket.send_multipart(envelope + [response.encode('utf-8')])
+
+    def _drain(self, socket, queue):
+        """Moves the requests waiting on ``socket`` into ``queue``, rejecting
+        those that exceed :attr:`max_queue`.
+        """
+
+        # Receive a bounded number of messages per round, so rejecting a
+        # flood of requests can't starve the ones already queued. Without a
+        # limit, requests are taken one by one and the backlog stays in
+        # ZeroMQ, bounded by the high-water mark.
+        for _ in range(self.max_queue or 1):
+            try:
+                frames = socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+            if self.max_queue is not None and len(queue) >= self.max_queue:
+                response = self._error_response("OVERLOADED")
+                socket.send_multipart(frames[:-1] + [response.encode('utf-8')])
+            else:
+                queue.append(frames)
+
+    def prepare(self, thread_id=None):
+        """Sets up profiling and signal handling for the calling thread,
+        which is going to serve requests. Called by :meth:`run` and by other
+        serving loops such as :class:`~twentiment.broker.Worker`.
+
+        :param thread_id: Identifier of the thread handling the requests, if
+            it isn't the calling thread. ``PROFILE`` samples this thread.
+        """
+
+        self._sampler = StackSampler(thread_id)
+        self._install_signal_handlers()
+
+    def _install_signal_handlers(self):
+        # Signal handlers can only be installed from the main thread.
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self._handle_profile_signal)
+
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._handle_reload_signal)
 
     def _handle_message(self, message):
+        if len(message) > self.MAX_MESSAGE:
+            return self._error_response("TOO_LARGE")
+
+        # Prefixes are stripped in a loop rather than by recursing, and each
+        # kind only once, so no request can nest them arbitrarily deep.
+        seen = set()
         try:
-            cmd, message = message.lower().split(" ", 1)
-        except ValueError:
-            return self._error_response("BAD_FORMAT")
+            while True:
+                cmd, sep, args = message.partition(" ")
+                cmd = cmd.lower()
+                prefix = self._prefixes.get(cmd)
+                if prefix is None:
+                    break
+                elif cmd in seen:
+                    return self._error_response("BAD_REQUEST")
+
+                seen.add(cmd)
+                message, response = prefix(args)
+                if message is None:
+                    return response
 
-        if cmd == 'guess':
-            return "OK {}".format(self._guess(message))
-        else:
-            return self._error_response("UNKNOWN_COMMAND")
+            handler = self._commands.get(cmd)
+            if not sep and cmd not in self.BARE_COMMANDS:
+                return self._error_response("BAD_FORMAT")
+            elif handler is None:
+                return self._error_response("UNKNOWN_COMMAND")
+
+            return handler(args)
+        finally:
+            self._request_id = None
 
     def _error_response(self, message):
         return "ERROR {}".format(message)
 
-    def _guess(self, message):
-        twfeat = extract_features(normalize_text(message))
-        result = self.classifier.prob_classify(twfeat)
-        return format(result.prob('positive') - result.prob('negative'))
+    def ready(self):
+        """Whether the server can answer ``GUESS`` requests."""
+
+        return self.classifier is not None
+
+    def _status_command(self, args):
+        fields = [('ready', int(self.ready()))]
+        if self.trainer is not None:
+            fields.extend(self.trainer.status())
+
+        return "OK {}".format(' '.join('{}={}'.format(field, value)
+                                       for (field, value) in fields))
+
+    def _memory_command(self, args):
+        from twentiment.memory import format_report
+
+        if not self.ready():
+            return self._error_response("NOT_READY")
+        return "OK {}".format(format_report(self.classifier.memory_report()))
+
+    def _deadline_prefix(self, args):
+        deadline, sep, request = args.partition(" ")
+        try:
+            deadline = float(deadline)
+        except ValueError:
+            return None, self._error_response("BAD_FORMAT")
+
+        if not sep or not 0 <= deadline < math.inf:
+            # Also rejects nan, which compares false to everything.
+            return None, self._error_response("BAD_FORMAT")
+        elif time.time() > deadline:
+            # Nobody is waiting for the response anymore.
+            return None, None
+
+        return request, None
+
+    def _id_prefix(self, args):
+        request_id, sep, request = args.partition(" ")
+        if not sep or not request_id:
+            return None, self._error_response("BAD_FORMAT")
+
+        # Reset by _handle_message once the request is answered.
+        self._request_id = request_id
+        return request, None
+
+    def _guess_command(self, args):
+        if not self.ready():
+            return self._error_response("NOT_READY")
+        elif self.slow_log is None:
+            return "OK {}".format(self._guess(args))
+
+        trace = self.slow_log.start(self._request_id, len(args))
+        response = "OK {}".format(self._guess(args, trace))
+        self.slow_log.finish(trace)
+        return response
+
+    def _profile_command(self, args):
+        if args.strip().lower() == 'stop':
+            if self._sampler is None or not self._sampler.running:
+                return self._error_response("NOT_PROFILING")
+            self._sampler.stop()
+            return "OK {}".format(self._sampler.path)
+
+        try:
+            seconds = float(args)
+        except ValueError:
+            return self._error_response("BAD_FORMAT")
+
+        if not 0 < seconds < math.inf:
+            return self._error_response("BAD_FORMAT")
+        seconds = min(seconds, self.MAX_PROFILE_SECONDS)
+
+        try:
+            path = self._start_profile(seconds)
+        except RuntimeError as err:
+            return self._error_response("RUNTIME_ERROR " + str(err))
+
+        return "OK {}".format(path)
+
+    def _handle_profile_signal(self, signum, frame):
+        try:
+            path = self._start_profile(self.PROFILE_SECONDS)
+        except RuntimeError:
+            return
+
+        print("Profiling for {}s into {}".format(self.PROFILE_SECONDS, path))
+
+    def _start_profile(self, seconds):
+        if self._sampler is None:
+            raise RuntimeError("Server is not running")
+
+        path = os.path.join(self.profile_dir, "twentiment-{}-{}.folded".format(
+            os.getpid(), int(time.time())))
+        return self._sampler.start(seconds, path)
+
+    def _reload_command(self, args):
+        path = args.strip()
+        if not path:
+            return self._error_response("BAD_FORMAT")
+
+        try:
+            self.reload(path)
+        except RuntimeError:
+            return self._error_response("RELOAD_IN_PROGRESS")
+
+        return "OK RELOADING {}".format(path)
+
+    def _handle_reload_signal(self, signum, frame):
+        if self.source is None:
+            print("No source to reload from")
+            return
+
+        try:
+            self.reload(self.source)
+        except RuntimeError:
+            print("Reload already in progress")
+
+    def reload(self, path):
+        """Loads a new classifier from ``path`` in a background thread and
+        swaps it in once it is ready. The current classifier keeps serving in
+        the meantime.
+
+        :raises RuntimeError: If another reload, or progressive training, is
+            still in progress.
+        :returns: The thread doing the work.
+        """
+
+        if self.trainer is not None and self.trainer.running:
+            raise RuntimeError("Progressive training in progress")
+
+        with self._reload_lock:
+            if self._reload_thread is not None and \
+                    self._reload_thread.is_alive():
+                raise RuntimeError("Reload already in progress")
+
+            self._reload_thread = threading.Thread(
+                target=self._reload, args=(path,), name='twentiment-reload')
+            self._reload_thread.daemon = True
+            self._reload_thread.start()
+
+        return self._reload_thread
+
+    def _reload(self, path):
+        loader = self.loader
+        if loader is None:
+            from twentiment.classifier import Classifier
+            loader = Classifier.from_path
+
+        start = time.perf_counter()
+        rss_before = resident_set_size()
+        max_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        try:
+            classifier = loader(path)
+        except Exception as err:
+            print("Reloading from {} failed: {}".format(path, err))
+            return
+
+        # Both models are still held in memory.
+        rss_loaded = resident_set_size()
+        # The peak of the whole process lifetime, which is the peak of the
+        # reload if it grew while loading.
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # Rebinding the attribute is atomic, so requests either see the old or
+        # the new classifier, never a half-built one.
+        self.classifier = classifier
+        self.source = path
+
+        self.last_reload = {
+            'path': path,
+            'seconds': time.perf_counter() - start,
+            # Current resident set sizes in KiB, ``None`` if unknown.
+            'rss_before': rss_before,
+            'rss_loaded': rss_loaded,
+            # High-water mark of the resident set size in KiB.
+            'max_rss': max_rss,
+            # Whether the high-water mark was set during the reload.
+            'new_peak': max_rss > max_rss_before,
+        }
+        print("Reloaded model from {path} in {seconds:.2f}s (RSS "
+              "{rss_before} KiB before, {rss_loaded} KiB with both models, "
+              "peak {max_rss} KiB{during})".format(
+                  during=' during the reload' if self.last_reload['new_peak']
+                  else '', **self.last_reload))
+
+    def _guess(self, message, trace=None):
+        if self.max_input is not None:
+            message = message[:self.max_input]
+
+        return format(self.classifier.score(message, trace))
+
+
+class Pipeline:
+    """Scores a continuous stream of tweets without replying to anybody.
+
+    Tweets are pulled from an upstream PUSH socket and their scores pushed on
+    to a downstream PULL socket, both of which the pipeline connects to::
+
+        upstream -> [id:str] [tweet:str]
+        downstream <- [id:str] [score:float]
+        downstream <- [id:str] ERROR [code:str] ...
+
+    The id is anything up to the first ASCII space and passed through
+    untouched. Tweets that can't be scored, e.g. because they aren't valid
+    UTF-8, get an error in place of the score, and scoring goes on with the
+    next one. As no message waits for a reply, the throughput is bounded by
+    the cost of scoring only. ZeroMQ hands the tweets out round robin, so the
+    throughput grows with the number of workers, forked after the model has
+    been frozen like for :class:`~twentiment.prefork.Prefork`. Workers that
+    die are replaced.
+    """
+
+    #: Milliseconds between two checks whether to stop.
+    POLL_INTERVAL = 1000
+    #: Seconds to wait before replacing a worker that died, so one that
+    #: fails right away doesn't keep the parent busy forking.
+    RESPAWN_DELAY = 1.0
+
+    def __init__(self, server, upstream="tcp://127.0.0.1:10003",
+                 downstream="tcp://127.0.0.1:10004", workers=1):
+        """
+        :param server: The server whose classifier, :attr:`Server.max_input`
+            and :attr:`Server.hwm` are used for scoring.
+        :param upstream: Endpoint of the PUSH socket sending the tweets.
+        :param downstream: Endpoint of the PULL socket receiving the scores.
+        :param workers: Number of scoring processes. With one, the tweets are
+            scored in the calling process.
+        """
+
+        self.server = server
+        self.upstream = upstream
+        self.downstream = downstream
+        self.workers = workers
+        self.pids = []
+        self._stopping = False
+
+    def stop(self, *args):
+        """Stops scoring after the current tweet."""
+
+        self._stopping = True
+
+    def run(self):
+        """Scores tweets until the process receives ``SIGTERM`` or
+        ``SIGINT``.
+        """
+
+        if self.workers == 1:
+            self._score()
+            return
+
+        from twentiment.prefork import fork, freeze
+        self.server.classifier = freeze(self.server.classifier)
+
+        for _ in range(self.workers):
+            self.pids.append(fork(self._score))
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            while True:
+                pid, status = os.wait()
+                if pid not in self.pids:
+                    continue
+
+                self.pids.remove(pid)
+                print("Worker {} exited with status {}, replacing it".format(
+                    pid, status))
+                time.sleep(self.RESPAWN_DELAY)
+                self.pids.append(fork(self._score))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for pid in self.pids:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+            for pid in self.pids:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+
+    def _score(self):
+        self.server.prepare()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        context = zmq.Context()
+        source = context.socket(zmq.PULL)
+        source.setsockopt(zmq.RCVHWM, self.server.hwm)
+        source.connect(self.upstream)
+        sink = context.socket(zmq.PUSH)
+        sink.setsockopt(zmq.SNDHWM, self.server.hwm)
+        sink.setsockopt(zmq.LINGER, 1000)
+        sink.connect(self.downstream)
+
+        print("Scoring tweets from {} into {}".format(self.upstream,
+                                                      self.downstream))
+        while not self._stopping:
+            try:
+                if not source.poll(self.POLL_INTERVAL):
+                    continue
+            except zmq.ZMQError:
+                # Interrupted by a signal, check whether to stop.
+                continue
+
+            # Drain everything that is waiting before polling again.
+            while not self._stopping:
+                try:
+                    message = source.recv(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+
+                tweet_id, _, text = message.partition(b' ')
+                sink.send(tweet_id + b' ' + self._score_one(text).encode(
+                    'utf-8'))
+
+        source.close(0)
+        sink.close()
+        context.term()
+
+    def _score_one(self, text):
+        """Returns the score of the UTF-8 encoded ``text``, or an error
+        response if it can't be scored.
+        """
+
+        if not self.server.ready():
+            return self.server._error_response("NOT_READY")
+
+        try:
+            return self.server._guess(str(text, 'utf-8'))
+        except UnicodeDecodeError:
+            return self.server._error_response("BAD_FORMAT")
+        except Exception as err:
+            traceback.print_exc()
+            return self.server._error_response("RUNTIME_ERROR " + str(err))
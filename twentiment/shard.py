@@ -0,0 +1,270 @@
+"""
+Sharded deployment: the vocabulary is hash partitioned across several shard
+servers, each of which only holds the feature probabilities of its partition.
+A coordinator scatters the tokens of a tweet to the shards owning them and
+adds up the partial log scores.
+
+This works because the naive bayes score of a label is the label's prior plus
+a sum over the features, and the probabilities of one feature only depend on
+that feature's own counts and the label counts. A shard trained on the
+training set restricted to its features therefore computes exactly the same
+terms as the full model.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import time
+import zlib
+import zmq
+from twentiment.extract import extract_features
+from twentiment.text import normalize_text
+from twentiment.server import Server
+
+
+def shard_of(fname, count):
+    """Returns the index of the shard owning the feature name ``fname``. The
+    hash is stable across processes and machines, unlike :func:`hash`.
+    """
+
+    return zlib.crc32(fname.encode('utf-8')) % count
+
+
+def format_scores(scores):
+    """Serializes a dict of label scores for the wire. ``repr`` is used so
+    floats survive the round trip exactly.
+
+    >>> format_scores({'negative': -0.5})
+    'negative=-0.5'
+    """
+
+    return ' '.join('{}={!r}'.format(label, value)
+                    for (label, value) in sorted(scores.items()))
+
+
+def parse_scores(text):
+    """Inverse of :func:`format_scores`.
+
+    >>> parse_scores('negative=-0.5 positive=-inf')
+    {'negative': -0.5, 'positive': -inf}
+    """
+
+    scores = {}
+    for item in text.split():
+        label, value = item.rsplit('=', 1)
+        scores[label] = float(value)
+
+    return scores
+
+
+class Shard:
+    """One partition of the vocabulary."""
+
+    def __init__(self, index, count):
+        if not 0 <= index < count:
+            raise ValueError("Shard index must be in [0, {})".format(count))
+
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, spec):
+        """Creates a shard from a string like ``"2/4"``, meaning the third of
+        four shards.
+        """
+
+        try:
+            index, count = spec.split('/')
+            return cls(int(index), int(count))
+        except ValueError:
+            raise ValueError("Invalid shard '{}', expected "
+                             "INDEX/COUNT".format(spec))
+
+    def owns(self, fname):
+        return shard_of(fname, self.count) == self.index
+
+    def filter(self, training_set):
+        """Restricts each featureset of ``training_set`` to the features owned
+        by this shard.
+        """
+
+        for featureset, label in training_set:
+            yield ({fname: fval for (fname, fval) in featureset.items()
+                    if self.owns(fname)}, label)
+
+    def __repr__(self):
+        return '<Shard {}/{}>'.format(self.index, self.count)
+
+
+class ShardServer(Server):
+    """Serves the partial scores of one shard.
+
+    Protocol::
+
+        -> PARTIAL [token:str] [token:str] ...
+        <- OK [label:str]=[logprob:float] ...
+
+        -> PRIORS
+        <- OK [label:str]=[logprob:float] ...
+
+    ``PARTIAL`` returns the sum of the feature log probabilities of the given
+    tokens for each label, ``PRIORS`` the log probability of each label.
+    ``GUESS`` is not available, as a shard only knows part of the vocabulary.
+    """
+
+    BARE_COMMANDS = Server.BARE_COMMANDS | frozenset(['priors'])
+
+    def __init__(self, classifier, *args, **kwargs):
+        super().__init__(classifier, *args, **kwargs)
+
+        del self._commands['guess']
+        self._commands['partial'] = self._partial_command
+        self._commands['priors'] = self._priors_command
+
+    def _partial_command(self, args):
+        featureset = {token: True for token in args.split()}
+        return "OK {}".format(format_scores(
+            self.classifier.feature_logprobs(featureset)))
+
+    def _priors_command(self, args):
+        return "OK {}".format(format_scores(self.classifier.label_logprobs()))
+
+
+class ShardUnavailable(RuntimeError):
+    """A shard timed out or answered with an error."""
+
+
+class Coordinator(Server):
+    """Answers ``GUESS`` requests by scattering the tweet's tokens to the
+    shard servers and gathering their partial scores. Requests to the shards
+    are sent all at once, so they are processed in parallel.
+
+    If a shard times out or answers with an error, the request is answered
+    with ``ERROR SHARD_UNAVAILABLE [description]`` and the coordinator keeps
+    serving.
+
+    The label priors are fetched from shard 0 and cached for
+    ``priors_ttl`` seconds, so a shard's ``RELOAD`` is picked up after at
+    most that long. The cache is dropped whenever a shard fails, as it may
+    have been restarted with a different model.
+    """
+
+    def __init__(self, shards, bind="tcp://127.0.0.1:10001", timeout=5.0,
+                 priors_ttl=60.0, **kwargs):
+        """
+        :param shards: List of the shard servers' endpoints, ordered by shard
+            index.
+        :param timeout: Seconds to wait for the shards to answer.
+        :param priors_ttl: Seconds the label priors are cached for.
+        """
+
+        super().__init__(None, bind, **kwargs)
+
+        del self._commands['reload']
+        del self._commands['memory']
+        self.shards = shards
+        self.timeout = timeout
+        self.priors_ttl = priors_ttl
+        self._sockets = None
+        self._priors = None
+        self._priors_expiry = 0.0
+
+    def ready(self):
+        return True
+
+    def _connect(self, index):
+        socket = zmq.Context.instance().socket(zmq.REQ)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(self.shards[index])
+        return socket
+
+    def _scatter_gather(self, requests):
+        """Sends ``requests``, a dict mapping shard indexes to messages, and
+        returns a dict mapping the indexes to the parsed scores.
+
+        :raises ShardUnavailable: If a shard timed out or answered with an
+            error.
+        """
+
+        # Sockets are created lazily, as they must belong to the serving
+        # thread.
+        if self._sockets is None:
+            self._sockets = [self._connect(n) for n in range(len(self.shards))]
+
+        poller = zmq.Poller()
+        pending = {}
+        for index, request in requests.items():
+            self._sockets[index].send_unicode(request)
+            poller.register(self._sockets[index], zmq.POLLIN)
+            pending[self._sockets[index]] = index
+
+        results = {}
+        errors = []
+        while pending:
+            events = dict(poller.poll(self.timeout * 1000))
+            if not events:
+                break
+
+            for socket in events:
+                index = pending.pop(socket)
+                poller.unregister(socket)
+                status, _, body = socket.recv_string().partition(' ')
+                if status == 'OK':
+                    results[index] = parse_scores(body)
+                else:
+                    errors.append("shard {}: {}".format(index, body))
+
+        # A REQ socket that never got its reply can't be used again.
+        for socket, index in pending.items():
+            socket.close()
+            self._sockets[index] = self._connect(index)
+            errors.append("shard {}: timed out".format(index))
+
+        if errors:
+            raise ShardUnavailable('; '.join(errors))
+
+        return results
+
+    def _guess_command(self, args):
+        try:
+            return super()._guess_command(args)
+        except ShardUnavailable as err:
+            self._priors = None
+            return self._error_response("SHARD_UNAVAILABLE " + str(err))
+
+    def _guess(self, message, trace=None):
+        from twentiment.thirdparty.probability import DictionaryProbDist
+
+        if self._priors is None or time.monotonic() >= self._priors_expiry:
+            self._priors = self._scatter_gather({0: 'PRIORS'})[0]
+            self._priors_expiry = time.monotonic() + self.priors_ttl
+
+        if self.max_input is not None:
+            message = message[:self.max_input]
+
+        tokens = normalize_text(message)
+        if trace is not None:
+            trace.tokens = len(tokens)
+            trace.mark('normalize')
+
+        by_shard = {}
+        for fname in extract_features(tokens):
+            by_shard.setdefault(shard_of(fname, len(self.shards)),
+                                []).append(fname)
+
+        logprob = dict(self._priors)
+        requests = {index: 'PARTIAL ' + ' '.join(fnames)
+                    for (index, fnames) in by_shard.items()}
+        partials = self._scatter_gather(requests)
+        if trace is not None:
+            trace.mark('shards')
+
+        for partial in partials.values():
+            for label, value in partial.items():
+                logprob[label] += value
+
+        result = DictionaryProbDist(logprob, normalize=True, log=True)
+        score = format(result.prob('positive') - result.prob('negative'))
+        if trace is not None:
+            trace.mark('combine')
+        return score
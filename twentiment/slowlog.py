@@ -0,0 +1,121 @@
+"""
+A log of slow requests, for finding out why they were slow.
+
+Every request is traced with a handful of :func:`time.perf_counter` calls, and
+only requests exceeding the threshold are formatted and written, so fast
+requests pay next to nothing. Whether the garbage collector ran during a
+request is noticed through :data:`gc.callbacks`.
+
+:author: 2012, Pascal Hartig <phartig@weluse.de>
+:license: Apache 2
+"""
+
+import gc
+import time
+import logging
+import logging.handlers
+
+
+class Trace:
+    """The durations of the stages of one request. Stages are recorded with
+    :meth:`mark`.
+    """
+
+    __slots__ = ('request_id', 'input_length', 'tokens', 'stages', 'start',
+                 'gc_runs', '_last')
+
+    def __init__(self, request_id, input_length, gc_runs):
+        self.request_id = request_id
+        self.input_length = input_length
+        #: Number of tokens of the normalized input, if known.
+        self.tokens = None
+        #: List of ``(stage, seconds)`` tuples.
+        self.stages = []
+        self.gc_runs = gc_runs
+        self.start = self._last = time.perf_counter()
+
+    def mark(self, stage):
+        """Records that ``stage`` ended now, and started when the previous one
+        ended.
+        """
+
+        now = time.perf_counter()
+        self.stages.append((stage, now - self._last))
+        self._last = now
+
+
+class SlowLog:
+    """Writes requests taking longer than a threshold to a rotating file.
+
+    One line is written per slow request, e.g.::
+
+        2012-06-01 12:00:00,000 id=a1 ms=153.2 input=140 tokens=21 gc=1
+            normalize_ms=150.9 features_ms=0.1 classify_ms=2.2
+
+    (without the line break). ``id`` is ``-`` for requests without an ID, and
+    ``gc`` is the number of garbage collector runs during the request.
+    """
+
+    def __init__(self, path, threshold=0.1, max_bytes=10 * 2**20,
+                 backup_count=5):
+        """
+        :param path: The log file.
+        :param threshold: Requests taking at least this many seconds are
+            logged.
+        :param max_bytes: Size at which the log file is rotated.
+        :param backup_count: Number of rotated files to keep.
+        """
+
+        self.path = path
+        self.threshold = threshold
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self._handler.setFormatter(
+            logging.Formatter('%(asctime)s %(message)s'))
+        self._logger = logging.getLogger('twentiment.slowlog.{}'.format(path))
+        self._logger.addHandler(self._handler)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._gc_runs = 0
+        gc.callbacks.append(self._count_gc)
+
+    def _count_gc(self, phase, info):
+        if phase == 'start':
+            self._gc_runs += 1
+
+    def close(self):
+        """Stops logging and closes the file."""
+
+        if self._count_gc in gc.callbacks:
+            gc.callbacks.remove(self._count_gc)
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+    def start(self, request_id, input_length):
+        """Returns a new :class:`Trace` for a request starting now."""
+
+        return Trace(request_id, input_length, self._gc_runs)
+
+    def finish(self, trace):
+        """Logs ``trace`` if it took longer than the threshold."""
+
+        seconds = time.perf_counter() - trace.start
+        if seconds >= self.threshold:
+            self._logger.info(self.format(trace, seconds,
+                                          self._gc_runs - trace.gc_runs))
+
+    @staticmethod
+    def format(trace, seconds, gc_runs):
+        """Formats a slow request as ``key=value`` pairs."""
+
+        fields = [
+            ('id', trace.request_id or '-'),
+            ('ms', '{:.1f}'.format(seconds * 1000)),
+            ('input', trace.input_length),
+            ('tokens', '-' if trace.tokens is None else trace.tokens),
+            ('gc', gc_runs),
+        ]
+        fields.extend(('{}_ms'.format(stage), '{:.1f}'.format(duration * 1000))
+                      for (stage, duration) in trace.stages)
+
+        return ' '.join('{}={}'.format(key, value) for (key, value) in fields)
@@ -11,7 +11,9 @@ import re
 import string
 
 
-EMOTICONS = frozenset([':)', ':(', '):', '(:', '(-:', ')-:', ':-)', ':-('])
+POSITIVE_EMOTICONS = frozenset([':)', '(:', ':-)', '(-:'])
+NEGATIVE_EMOTICONS = frozenset([':(', '):', ':-(', ')-:'])
+EMOTICONS = POSITIVE_EMOTICONS | NEGATIVE_EMOTICONS
 
 
 def normalize_text(text):
@@ -208,8 +208,8 @@ class FreqDist(dict):
 
     def _cache_Nr_values(self):
         Nr = [0]
-        for sample in self:
-            c = self.get(sample, 0)
+        # Iterate the plain dict, as sorting the samples isn't needed.
+        for c in dict.values(self):
             if c >= len(Nr):
                 Nr += [0]*(c+1-len(Nr))
             Nr[c] += 1
@@ -451,6 +451,11 @@ class FreqDist(dict):
         self._reset_caches()
         dict.clear(self)
 
+    def __reduce__(self):
+        # Pickle the counts as dict items, which are restored with
+        # __setitem__ once __init__ has set up the total.
+        return (self.__class__, (), None, None, iter(dict.items(self)))
+
     def _reset_caches(self):
         self._Nr_cache = None
         self._max_cache = None
@@ -574,6 +579,34 @@ class ProbDistI(object):
         """
         return 0.0
 
+    def freeze(self):
+        """
+        Return a distribution with the same probabilities whose ``prob``
+        and ``logprob`` are table lookups.  This is possible for
+        distributions where the probability of a sample only depends on
+        its count in a frequency distribution; these precompute one entry
+        per distinct count, see ``FrozenProbDist``.  Other distributions
+        return themselves.
+
+        The frequency distribution must not be modified afterwards.
+
+        :rtype: ProbDistI
+        """
+        counts = self._counts()
+        if counts is None:
+            return self
+        return FrozenProbDist(self, counts)
+
+    def _counts(self):
+        """
+        Return the frequency distribution whose counts alone determine
+        the probabilities of this distribution, or None if there is no
+        such distribution.
+
+        :rtype: FreqDist or None
+        """
+        return None
+
     # Subclasses should define more efficient implementations of this,
     # where possible.
     def generate(self):
@@ -724,6 +757,9 @@ class MLEProbDist(ProbDistI):
         """
         return self._freqdist
 
+    def _counts(self):
+        return self._freqdist
+
     def prob(self, sample):
         return self._freqdist.freq(sample)
 
@@ -808,6 +844,9 @@ class LidstoneProbDist(ProbDistI):
         """
         return self._freqdist
 
+    def _counts(self):
+        return self._freqdist
+
     def prob(self, sample):
         c = self._freqdist[sample]
         return (c + self._gamma) / self._divisor
@@ -929,20 +968,21 @@ class HeldoutProbDist(ProbDistI):
 
     In order to increase the efficiency of the ``prob`` member
     function, *Tr[r]/(Nr[r].N)* is precomputed for each value of *r*
-    when the ``HeldoutProbDist`` is created.
+    when the ``HeldoutProbDist`` is created.  Only the values of *r*
+    that actually occur are considered, so the cost doesn't depend on
+    how large the counts are.
 
-    :type _estimate: list(float)
-    :ivar _estimate: A list mapping from *r*, the number of
+    :type _estimate: dict(int, float)
+    :ivar _estimate: A dict mapping from *r*, the number of
         times that a sample occurs in the base distribution, to the
         probability estimate for that sample.  ``_estimate[r]`` is
         calculated by finding the average frequency in the heldout
         distribution of all samples that occur *r* times in the base
         distribution.  In particular, ``_estimate[r]`` =
-        *Tr[r]/(Nr[r].N)*.
+        *Tr[r]/(Nr[r].N)*.  Values of *r* with *Nr[r]=0* are missing.
     :type _max_r: int
     :ivar _max_r: The maximum number of times that any sample occurs
-        in the base distribution.  ``_max_r`` is used to decide how
-        large ``_estimate`` must be.
+        in the base distribution.
     """
     SUM_TO_ONE = False
     def __init__(self, base_fdist, heldout_fdist, bins=None):
@@ -967,11 +1007,13 @@ class HeldoutProbDist(ProbDistI):
         self._heldout_fdist = heldout_fdist
 
         # The max number of times any sample occurs in base_fdist.
-        self._max_r = base_fdist[base_fdist.max()]
+        self._max_r = max(dict.values(base_fdist)) if base_fdist else 0
 
         # Calculate Tr, Nr, and N.
         Tr = self._calculate_Tr()
-        Nr = [base_fdist.Nr(r, bins) for r in range(self._max_r+1)]
+        Nr = {0: base_fdist.Nr(0, bins)}
+        for r in dict.values(base_fdist):
+            Nr[r] = Nr.get(r, 0) + 1
         N = heldout_fdist.N()
 
         # Use Tr, Nr, and N to compute the probability estimate for
@@ -980,42 +1022,42 @@ class HeldoutProbDist(ProbDistI):
 
     def _calculate_Tr(self):
         """
-        Return the list *Tr*, where *Tr[r]* is the total count in
+        Return the dict *Tr*, where *Tr[r]* is the total count in
         ``heldout_fdist`` for all samples that occur *r*
         times in ``base_fdist``.
 
-        :rtype: list(float)
+        :rtype: dict(int, float)
         """
-        Tr = [0.0] * (self._max_r+1)
-        for sample in self._heldout_fdist:
-            r = self._base_fdist[sample]
-            Tr[r] += self._heldout_fdist[sample]
+        Tr = {}
+        for sample, count in dict.items(self._heldout_fdist):
+            r = dict.get(self._base_fdist, sample, 0)
+            Tr[r] = Tr.get(r, 0.0) + count
         return Tr
 
     def _calculate_estimate(self, Tr, Nr, N):
         """
-        Return the list *estimate*, where *estimate[r]* is the probability
+        Return the dict *estimate*, where *estimate[r]* is the probability
         estimate for any sample that occurs *r* times in the base frequency
         distribution.  In particular, *estimate[r]* is *Tr[r]/(N[r].N)*.
         In the special case that *N[r]=0*, *estimate[r]* will never be used;
-        so we define *estimate[r]=None* for those cases.
+        so it is left out.
 
-        :rtype: list(float)
-        :type Tr: list(float)
-        :param Tr: the list *Tr*, where *Tr[r]* is the total count in
+        :rtype: dict(int, float)
+        :type Tr: dict(int, float)
+        :param Tr: the dict *Tr*, where *Tr[r]* is the total count in
             the heldout distribution for all samples that occur *r*
             times in base distribution.
-        :type Nr: list(float)
-        :param Nr: The list *Nr*, where *Nr[r]* is the number of
+        :type Nr: dict(int, int)
+        :param Nr: The dict *Nr*, where *Nr[r]* is the number of
             samples that occur *r* times in the base distribution.
         :type N: int
         :param N: The total number of outcomes recorded by the heldout
             frequency distribution.
         """
-        estimate = []
-        for r in range(self._max_r+1):
-            if Nr[r] == 0: estimate.append(None)
-            else: estimate.append(Tr[r]/(Nr[r]*N))
+        estimate = {}
+        for r, nr in Nr.items():
+            if nr != 0:
+                estimate[r] = Tr.get(r, 0.0)/(nr*N)
         return estimate
 
     def base_fdist(self):
@@ -1027,6 +1069,9 @@ class HeldoutProbDist(ProbDistI):
         """
         return self._base_fdist
 
+    def _counts(self):
+        return self._base_fdist
+
     def heldout_fdist(self):
         """
         Return the heldout frequency distribution that this
@@ -1040,9 +1085,10 @@ class HeldoutProbDist(ProbDistI):
         return self._base_fdist.keys()
 
     def prob(self, sample):
-        # Use our precomputed probability estimate.
-        r = self._base_fdist[sample]
-        return self._estimate[r]
+        # Use our precomputed probability estimate.  There is no estimate
+        # for unseen samples if there are no unseen bins, so they can't
+        # occur.
+        return self._estimate.get(self._base_fdist[sample], 0.0)
 
     def max(self):
         # Note: the Heldout estimation is *not* necessarily monotonic;
@@ -1090,12 +1136,39 @@ class CrossValidationProbDist(ProbDistI):
 
         # Create a heldout probability distribution for each pair of
         # frequency distributions in freqdists.
-        self._heldout_probdists = []
+        heldout_probdists = []
         for fdist1 in freqdists:
             for fdist2 in freqdists:
                 if fdist1 is not fdist2:
                     probdist = HeldoutProbDist(fdist1, fdist2, bins)
-                    self._heldout_probdists.append(probdist)
+                    heldout_probdists.append(probdist)
+
+        # Average the heldout estimates once for every sample, and once
+        # for all unseen samples, so that prob() is a single lookup.
+        samples = set()
+        for fdist in freqdists:
+            samples.update(dict.keys(fdist))
+
+        self._estimates = {}
+        for sample in samples:
+            self._estimates[sample] = self._average(heldout_probdists, sample)
+        self._unseen = self._average(heldout_probdists, object())
+
+        self._logestimates = {}
+        for sample, prob in self._estimates.items():
+            self._logestimates[sample] = (math.log(prob, 2) if prob != 0
+                                          else _NINF)
+        self._unseen_log = (math.log(self._unseen, 2) if self._unseen != 0
+                            else _NINF)
+
+    @staticmethod
+    def _average(heldout_probdists, sample):
+        # Find the average probability estimate returned by each
+        # heldout distribution.
+        prob = 0.0
+        for heldout_probdist in heldout_probdists:
+            prob += heldout_probdist.prob(sample)
+        return prob/len(heldout_probdists)
 
     def freqdists(self):
         """
@@ -1106,16 +1179,14 @@ class CrossValidationProbDist(ProbDistI):
         return self._freqdists
 
     def samples(self):
-        # [xx] nb: this is not too efficient
-        return set(sum([fd.keys() for fd in self._freqdists], []))
+        return set(self._estimates)
 
     def prob(self, sample):
-        # Find the average probability estimate returned by each
-        # heldout distribution.
-        prob = 0.0
-        for heldout_probdist in self._heldout_probdists:
-            prob += heldout_probdist.prob(sample)
-        return prob/len(self._heldout_probdists)
+        # Use our precomputed average of the heldout estimates.
+        return self._estimates.get(sample, self._unseen)
+
+    def logprob(self, sample):
+        return self._logestimates.get(sample, self._unseen_log)
 
     def discount(self):
         raise NotImplementedError()
@@ -1199,6 +1270,9 @@ class WittenBellProbDist(ProbDistI):
     def freqdist(self):
         return self._freqdist
 
+    def _counts(self):
+        return self._freqdist
+
     def discount(self):
         raise NotImplementedError()
 
@@ -1321,6 +1395,9 @@ class GoodTuringProbDist(ProbDistI):
     def freqdist(self):
         return self._freqdist
 
+    def _counts(self):
+        return self._freqdist
+
     def __repr__(self):
         """
         Return a string representation of this ``ProbDist``.
@@ -1537,6 +1614,9 @@ class SimpleGoodTuringProbDist(ProbDistI):
     def freqdist(self):
         return self._freqdist
 
+    def _counts(self):
+        return self._freqdist
+
     def __repr__(self):
         """
         Return a string representation of this ``ProbDist``.
@@ -1547,6 +1627,78 @@ class SimpleGoodTuringProbDist(ProbDistI):
                 % self._freqdist.N()
 
 
+class FrozenProbDist(ProbDistI):
+    """
+    A read-only copy of a probability distribution whose probabilities
+    only depend on the count of a sample in a frequency distribution,
+    such as the Lidstone, Witten-Bell, Good-Turing and heldout
+    estimates.  The probability and log probability of every distinct
+    count are computed once, so ``prob`` and ``logprob`` are a count
+    lookup followed by a table lookup, no matter how expensive the
+    original estimate is.  Use ``ProbDistI.freeze`` to create one.
+    """
+    SUM_TO_ONE = False
+
+    def __init__(self, prob_dist, freqdist):
+        """
+        :param prob_dist: The distribution to copy.
+        :type prob_dist: ProbDistI
+        :param freqdist: The frequency distribution whose counts
+            determine the probabilities of ``prob_dist``.
+        :type freqdist: FreqDist
+        """
+        # One sample per distinct count is enough to query the estimate.
+        # A fresh object stands in for the unseen samples.
+        representatives = {}
+        for sample, count in dict.items(freqdist):
+            representatives.setdefault(count, sample)
+        representatives[0] = object()
+
+        self._freqdist = freqdist
+        self._prob = {}
+        self._logprob = {}
+        for count, sample in representatives.items():
+            self._prob[count] = prob_dist.prob(sample)
+            self._logprob[count] = prob_dist.logprob(sample)
+        self.SUM_TO_ONE = prob_dist.SUM_TO_ONE
+
+    def freqdist(self):
+        """
+        Return the frequency distribution that this probability
+        distribution is based on.
+
+        :rtype: FreqDist
+        """
+        return self._freqdist
+
+    def prob(self, sample):
+        return self._prob[dict.get(self._freqdist, sample, 0)]
+
+    def logprob(self, sample):
+        return self._logprob[dict.get(self._freqdist, sample, 0)]
+
+    def max(self):
+        return self._freqdist.max()
+
+    def samples(self):
+        return self._freqdist.keys()
+
+    def discount(self):
+        # The original distribution is not kept around.
+        raise NotImplementedError()
+
+    def freeze(self):
+        return self
+
+    def __repr__(self):
+        """
+        Return a string representation of this ``ProbDist``.
+
+        :rtype: str
+        """
+        return '<FrozenProbDist based on %d samples>' % self._freqdist.N()
+
+
 class MutableProbDist(ProbDistI):
     """
     An mutable probdist where the probabilities may be easily modified. This